@@ -0,0 +1,180 @@
+"""
+File: benchmark.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    The allocation regression gate of the render hot path.
+
+    The HUD and the main_render are rendered offscreen with the virtual clock,
+    the per-frame allocations are traced by the tracemalloc after the warm-up frames.
+    It fails if the per-frame peak or the net growth exceeds the budget,
+    or if the GC collects during the measured frames,
+    or if the bounding boxes cached by the TextRenderer grow faster than the throttled HUD text.
+
+    The HUD is throttled by the virtual clock, so the result is deterministic.
+    Without the display, run it on the EGL, like
+        PYOPENGL_PLATFORM=egl EGL_PLATFORM=surfaceless python benchmark.py --font <font>
+    The budgets are measured in that way (Mesa llvmpipe, 2000 frames at 120 Hz) with 1.5x headroom,
+    re-run with the --calibrate to update them.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import gc
+import tracemalloc
+import numpy as np
+
+from util.clock import VirtualClock
+from util.glfw_opengl import HUD_INTERVAL
+from util.logging import logger
+
+FONT_PATH = './font/msyh.ttc'
+
+# The max transient allocations (bytes) within one frame, the measured max is 2268 bytes.
+FRAME_PEAK_BUDGET = 3402
+
+# The max net growth (bytes) over all the measured frames, the measured growth is 9396 bytes,
+# it is mostly the bounding boxes of the HUD clock texts.
+GROWTH_BUDGET = 14094
+
+# The headroom of the calibrated budgets.
+CALIBRATION_HEADROOM = 1.5
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+def measure_allocations(n_frames: int = 2000, warmup: int = 200, refresh_rate: float = 120,
+                        running: bool = True, hud: bool = True, font_path: str = FONT_PATH):
+    '''
+    Measure the allocations of the render hot path.
+
+    :param n_frames: The number of the measured frames.
+    :param warmup: The number of the frames before the measuring, to fill the caches.
+    :param refresh_rate: The virtual refresh rate (Hz).
+    :param running: Whether the stopwatch is running, like in the trials.
+    :param hud: Whether to draw the HUD, it is throttled by the virtual clock.
+
+    :return: The per-frame peaks (bytes), the net growth (bytes), the gc collections,
+             and the new bounding boxes cached by the TextRenderer.
+    '''
+    import main
+
+    # The GC is not disabled in the blink stages, nor collected at the cues,
+    # so the collections show the allocation pressure.
+    main.DISABLE_GC_WHILE_BLINKING = False
+    clock = VirtualClock()
+    main.sw.clock = clock
+    if running:
+        main.sw.start()
+        # The GC is enabled, so the collections show the allocation pressure.
+        gc.enable()
+
+    wnd = main.wnd
+    wnd.hud_timer = clock
+    wnd.load_font(font_path)
+
+    peaks = np.zeros(n_frames, dtype=np.int64)
+    state = {'current': 0, 'start': 0, 'collections': 0, 'boxes': 0}
+    boxes = wnd.text_renderer.boxes
+
+    def on_gc(phase, info):
+        if phase == 'start' and tracemalloc.is_tracing():
+            state['collections'] += 1
+
+    def render():
+        clock.set(wnd.frame_count / refresh_rate)
+        if hud:
+            wnd.draw_hud()
+        main.main_render()
+
+    def on_frame(i, pixels):
+        if i == warmup - 1:
+            # Start from the empty young generation, so the collections are caused by the measured frames.
+            gc.collect()
+            state['boxes'] = sum(len(b) for b in boxes.values())
+            tracemalloc.start()
+            state['start'] = state['current'] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        elif i >= warmup:
+            current, peak = tracemalloc.get_traced_memory()
+            peaks[i - warmup] = peak - state['current']
+            state['current'] = current
+            tracemalloc.reset_peak()
+            if i == warmup + n_frames - 1:
+                state['boxes'] = sum(len(b) for b in boxes.values()) - state['boxes']
+
+    gc.callbacks.append(on_gc)
+    try:
+        wnd.render_offscreen(render, warmup + n_frames, on_frame=on_frame)
+        growth = state['current'] - state['start']
+    finally:
+        tracemalloc.stop()
+        gc.callbacks.remove(on_gc)
+
+    return peaks, growth, state['collections'], state['boxes']
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Fail if the render hot path allocates over the budget.')
+    parser.add_argument('--frames', type=int, default=2000)
+    parser.add_argument('--peak-budget', type=int, default=FRAME_PEAK_BUDGET)
+    parser.add_argument('--growth-budget', type=int, default=GROWTH_BUDGET)
+    parser.add_argument('--refresh-rate', type=float, default=120)
+    parser.add_argument('--no-hud', action='store_true',
+                        help='Leave out the HUD.')
+    parser.add_argument('--font', default=FONT_PATH)
+    parser.add_argument('--calibrate', action='store_true',
+                        help='Print the budgets of the measured values with the headroom, and exit.')
+    args = parser.parse_args()
+
+    peaks, growth, collections, boxes = measure_allocations(
+        args.frames, refresh_rate=args.refresh_rate, hud=not args.no_hud, font_path=args.font)
+    print(f'Per-frame peak: median {np.median(peaks):.0f}, max {peaks.max()} bytes')
+    print(f'Net growth: {growth} bytes over {args.frames} frames')
+    print(f'GC collections: {collections}')
+    print(f'New bounding boxes: {boxes}')
+
+    # The HUD clock text is rebuilt once per HUD_INTERVAL, the other texts are cached in the warm-up.
+    max_boxes = 0 if args.no_hud else int(np.ceil(args.frames / args.refresh_rate / HUD_INTERVAL)) + 1
+
+    if args.calibrate:
+        print(f'FRAME_PEAK_BUDGET = {int(peaks.max() * CALIBRATION_HEADROOM)}')
+        print(f'GROWTH_BUDGET = {max(int(growth * CALIBRATION_HEADROOM), 1024)}')
+        raise SystemExit(0)
+
+    failed = []
+    if peaks.max() > args.peak_budget:
+        failed.append(f'per-frame peak {peaks.max()} > {args.peak_budget}')
+    if growth > args.growth_budget:
+        failed.append(f'net growth {growth} > {args.growth_budget}')
+    if collections > 0:
+        failed.append(f'{collections} GC collections')
+    if boxes > max_boxes:
+        failed.append(f'{boxes} new bounding boxes > {max_boxes}')
+    if failed:
+        logger.error('Allocation budget exceeded: ' + ', '.join(failed))
+        raise SystemExit(1)
+    print('Allocation budget OK.')
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
@@ -18,17 +18,61 @@ Functions:
 
 # %% ---- 2025-04-13 ------------------------
 # Requirements and constants
+import os
+import gc
 import glfw
 import time
 import numpy as np
 
+from datetime import datetime
+
 from threading import Thread
 
 from OpenGL.GL import *
 
-from util.glfw_opengl import GLFWWindow, TextAnchor
+from util.glfw_opengl import GLFWWindow, TextAnchor, GRAYS, HUD_INTERVAL
 from util.logging import logger
-from ssvep_design import SSVEPLayout
+from util.clock import RealClock
+from ssvep_design import SSVEPLayout, blink_luminance
+from ssvep_decoder import DynamicStoppingDecoder
+from ssvep_trca import TRCADecoder
+from ssvep_recorder import SessionRecorder
+from ssvep_verify import verify_layout
+from ssvep_monitor import SpectrumMonitor
+from ssvep_results import ResultsStore
+from ssvep_epochs import DROPPED_FRAME_FACTOR
+from ssvep_feedback import FeedbackChannel, FeedbackServer, SELECTION
+
+# Freeze the setup objects while running, and disable the GC in the blink stages,
+# so the GC does not pause in the middle of the stimulus.
+# The garbage is collected at the start of every cue stage.
+DISABLE_GC_WHILE_BLINKING = True
+
+# The subject of the session, it is stored with the results.
+SUBJECT = os.environ.get('SSVEP_SUBJECT', 'anonymous')
+
+# The trained TRCA model file, it is memory-mapped by the TRCADecoder at the startup.
+TRCA_MODEL = os.environ.get('SSVEP_TRCA_MODEL')
+
+# The index of the operator monitor in the glfw.get_monitors(), None for the single display.
+OPERATOR_MONITOR = None
+
+GREEN = (0.0, 1.0, 0, 1.0)
+YELLOW = (1.0, 1.0, 0.0, 1.0)
+RED = (1.0, 0, 0, 1.0)
+BLACK = (0.0, 0.0, 0.0, 1.0)
+BLUE = (0.0, 0.4, 1.0, 1.0)
+
+# The duration (seconds) of showing the selected target.
+FEEDBACK_HOLD = 0.5
+
+# The patches are offset and the labels are formatted once, not per frame.
+# (k, i, freq, x, y, w, h, label), the k is the position in the confidence vector.
+BLINKS = [(k, i, freq, x + 0.05, y + 0.05, w, h, f'{freq}')
+          for k, (i, (freq, x, y, w, h)) in enumerate(SSVEPLayout.blinks.items())]
+# (i, text, x, y, w, h)
+CUES = [(i, s, x + 0.05, y + 0.05, w, h)
+        for i, (s, x, y, w, h) in SSVEPLayout.cues.items()]
 
 
 # %% ---- 2025-04-13 ------------------------
@@ -36,15 +80,25 @@ from ssvep_design import SSVEPLayout
 
 class StopWatch:
     running: bool = False
-    tic: float = time.time()
+
+    def __init__(self, clock=None):
+        self.clock = RealClock() if clock is None else clock
+        self.tic = self.clock.now()
 
     def start(self):
-        self.tic = time.time()
+        if DISABLE_GC_WHILE_BLINKING:
+            gc.collect()
+            gc.freeze()
+        self.tic = self.clock.now()
         self.running = True
+        trial.reset()
         logger.info('Start running.')
 
     def stop(self):
         self.running = False
+        if DISABLE_GC_WHILE_BLINKING:
+            gc.unfreeze()
+            gc.enable()
         logger.info('Stop running.')
 
     def toggle(self):
@@ -54,16 +108,186 @@ class StopWatch:
             self.start()
 
     def peek(self):
-        return time.time() - self.tic
+        return self.clock.now() - self.tic
+
+
+class TrialSchedule:
+    '''
+    The trials run one by one,
+    the blink stage ends early when the decoder makes the decision.
+    '''
+    onset: float = 0.0
+    count: int = 0
+    blinking: bool = False
+    marked: int = -1
+    dropped: int = 0
+    last_frame: float = None
+
+    def __init__(self):
+        # (cue, freq, predicted, predicted_freq, decision_time, dropped_frames) of the finished trials,
+        # they are kept across the runs and stored at the end of the session.
+        self.results = []
+
+    def reset(self):
+        self.onset = 0.0
+        self.count = 0
+        self.blinking = False
+        self.marked = -1
+        self.dropped = 0
+
+    def next_trial(self, t: float, decision=None, timeout: bool = False):
+        '''
+        Finish the trial and start the next one at the time t.
+
+        :param decision: The Decision of the trial, None if there is no prediction.
+        :param timeout: Whether the blink stage runs to the end,
+                        the decision time is the blink_length then, with or without the prediction.
+        '''
+        cue = self.count % len(SSVEPLayout.cues) + 1
+        freq = SSVEPLayout.blinks[cue][0]
+        duration = SSVEPLayout.blink_length if timeout else None
+        if decision is None:
+            self.results.append((cue, freq, None, None, duration, self.dropped))
+        else:
+            duration = duration or decision.duration
+            self.results.append((cue, freq, decision.targets[0], float(decision.freq),
+                                 duration, self.dropped))
+
+        feedback.report_trial(self.count)
+
+        self.onset = t
+        self.count += 1
+        self.blinking = False
+        self.dropped = 0
+
+        # The cue stage tolerates the pause, the garbage of the last trial is collected here.
+        if DISABLE_GC_WHILE_BLINKING:
+            gc.enable()
+            gc.collect()
+
+    def start_blinking(self):
+        '''
+        Start the blink stage, the GC is disabled until the next trial.
+        '''
+        self.blinking = True
+        if DISABLE_GC_WHILE_BLINKING:
+            gc.disable()
+
+    def count_frame(self, t: float, refresh_rate: float):
+        '''
+        Count the dropped frames of the trial by the frame timestamps.
+        '''
+        if self.last_frame is not None and t - self.last_frame > DROPPED_FRAME_FACTOR / refresh_rate:
+            self.dropped += 1
+        self.last_frame = t
+
+    def seek(self, t: float, total: float):
+        '''
+        Jump to the trial at the time t, the trials are in the fixed length.
+        '''
+        self.count = int(t // total)
+        self.onset = self.count * total
+        self.blinking = t - self.onset > SSVEPLayout.cue_length
+        self.marked = self.count
+
+
+class SNRLabels:
+    '''
+    The SNR labels of the blinks, they are rebuilt only when the monitor publishes.
+    '''
+    version: int = -1
+    labels: dict = {}  # {freq: label}
+    lines: list = []  # The lines of the operator screen.
+
+    def update(self, monitor: SpectrumMonitor):
+        if monitor.version == self.version:
+            return
+        self.version = monitor.version
+        self.labels = {f: f'{snr:.1f} dB'
+                       for f, snr in zip(monitor.freqs.tolist(), monitor.snr.tolist())}
+        self.lines = [f'{f} Hz: {label}' for f, label in self.labels.items()]
+
+
+class OperatorText:
+    '''
+    The texts of the operator screen,
+    the trial text is rebuilt only when the trial changes,
+    and the FPS texts of the displays are rebuilt every HUD_INTERVAL seconds.
+    '''
+    key: tuple = None
+    trial: str = ''
+    fps: list = []
+    tic: float = 0.0
+
+    def update(self, now: float):
+        key = (trial.count, sw.running)
+        if key != self.key:
+            self.key = key
+            n = len(SSVEPLayout.cues)
+            self.trial = f'Trial {trial.count}, cue {trial.count % n + 1}, running: {sw.running}'
+
+        if now - self.tic > HUD_INTERVAL:
+            self.tic = now
+            self.fps = [display_fps(d) for d in wnd.displays]
+
+
+class FeedbackView:
+    '''
+    The latest feedback, it is shown by the main_render,
+    all the selected targets are highlighted, they share the decoded frequency.
+    '''
+    targets: tuple = ()
+    until: float = 0.0
+    confidence: np.ndarray = None
+
+    def update(self, message, now: float):
+        if message.kind == SELECTION:
+            self.targets = message.targets
+            self.until = now + FEEDBACK_HOLD
+        else:
+            # The length is checked by the feedback channel.
+            self.confidence = message.confidence
 
 
 sw = StopWatch()
+trial = TrialSchedule()
+snr_labels = SNRLabels()
+operator_text = OperatorText()
+
+# The external decoder posts to the feedback, by the thread or the FeedbackServer socket.
+feedback = FeedbackChannel(n_targets=len(BLINKS))
+feedback_view = FeedbackView()
+
+# Assign the DynamicStoppingDecoder.from_layout(SSVEPLayout, ...), or the TRCADecoder by the TRCA_MODEL,
+# and feed it by the acquisition thread to enable the dynamic stopping.
+decoder: DynamicStoppingDecoder | TRCADecoder = None
+
+# Assign the SpectrumMonitor.from_layout(SSVEPLayout, ...) and feed it
+# by the acquisition thread to show the SNR of the blinks.
+monitor: SpectrumMonitor = None
+
+# The session recorder, it is None in the replay.
+recorder: SessionRecorder = None
+
+
+def display_fps(display):
+    '''
+    The FPS text of the display, with the skipped frames of the extra displays.
+    '''
+    text = f'{display.name}: {display.fps.get_fps():.2f} FPS ({display.refresh_rate} Hz)'
+    if display.skipped:
+        text += f', skipped {display.skipped}'
+    return text
 
 
 def performance_ruler():
     while True:
         time.sleep(10)
         print(f"FPS: {wnd.fps.get_fps()}")
+        for d in wnd.displays:
+            print(display_fps(d))
+        for name, stats in wnd.profiler.percentiles().items():
+            print(f"{name}: " + ', '.join(f'{k}={v:.3f}' for k, v in stats.items()))
     return
 
 
@@ -84,8 +308,15 @@ def key_callback(window, key, scancode, action, mods):
 
     try:
         c = chr(key)
-        if c == 'S':
-            sw.toggle()
+        if c == 'P':
+            wnd.profiler.toggle()
+        elif c == 'S':
+            # Reject the bad frequencies before the session starts.
+            if not sw.running and not verify_layout(SSVEPLayout, [wnd.refresh_rate]).ok():
+                logger.error(
+                    f'The layout is rejected at {wnd.refresh_rate} Hz, see the warnings.')
+            else:
+                sw.toggle()
     except Exception as e:
         pass
 
@@ -101,49 +332,88 @@ def cos(t):
 
 
 def main_render():
-    t = sw.peek()
+    # Pick up the feedback at the frame start, it is shown in this frame.
+    now = sw.peek()
+    message = feedback.poll()
+    if message is not None:
+        feedback_view.update(message, now)
+
+    t = now
 
     total = SSVEPLayout.cue_length + SSVEPLayout.blink_length
     n = len(SSVEPLayout.cues)
-    this_i = int(t / total) % n + 1
-
-    t %= total
 
-    for i, patch in SSVEPLayout.blinks.items():
-        freq, x, y, w, h = patch
-        x += 0.05
-        y += 0.05
-
-        if sw.running:
-            if t > SSVEPLayout.cue_length:
-                # Draw blink
-                c = cos(t*freq) * 0.5 + 0.5
-                wnd.draw_rect(x, y, w, h, (c, c, c, 1.0))
+    if sw.running:
+        if t - trial.onset >= total:
+            # Force the decision with the samples so far, the decoder may lag the frames.
+            decision = None
+            if trial.blinking and decoder is not None:
+                decoder.finish()
+                decision = decoder.poll_decision()
+            trial.next_trial(trial.onset + total, decision, timeout=True)
+        elif trial.blinking and decoder is not None:
+            decision = decoder.poll_decision()
+            if decision is not None:
+                logger.info(f'Trial {trial.count} stops early: {decision}')
+                feedback.post_selection(decision.targets)
+                trial.next_trial(t, decision)
+
+        if not trial.blinking and t - trial.onset > SSVEPLayout.cue_length:
+            trial.start_blinking()
+            if decoder is not None:
+                decoder.reset()
+
+        this_i = trial.count % n + 1
+        t -= trial.onset
+
+        if trial.marked != trial.count and recorder is not None:
+            recorder.append_marker(this_i, wnd.frame_count)
+            trial.marked = trial.count
+    else:
+        this_i = int(t / total) % n + 1
+        t %= total
+
+    if monitor is not None:
+        snr_labels.update(monitor)
+
+    with wnd.profiler.scope('blinks'):
+        for k, i, freq, x, y, w, h, label in BLINKS:
+            if i in feedback_view.targets and now < feedback_view.until:
+                wnd.draw_rect(x-w*0.15, y-h*0.15, w*1.3, h*1.3, BLUE)
+
+            if sw.running:
+                if t > SSVEPLayout.cue_length:
+                    # Draw blink
+                    c = blink_luminance(t, freq)
+                    wnd.draw_rect(x, y, w, h, GRAYS[int(c * 255 + 0.5)])
+                else:
+                    # Draw green
+                    wnd.draw_rect(x, y, w, h, GREEN)
             else:
-                # Draw green
-                wnd.draw_rect(x, y, w, h, (0.0, 1.0, 0, 1.0))
-        else:
-            # Draw yellow
-            wnd.draw_rect(x, y, w, h, (1.0, 1.0, 0.0, 1.0))
-            c = cos(t+x+y) * 0.5 + 0.5
-            wnd.draw_rect(x, y, w, h, (c, c, c, 1.0))
+                # Draw yellow
+                wnd.draw_rect(x, y, w, h, YELLOW)
+                c = cos(t+x+y) * 0.5 + 0.5
+                wnd.draw_rect(x, y, w, h, GRAYS[int(c * 255 + 0.5)])
 
-        wnd.draw_text(f'{freq}', x, y,
-                      SSVEPLayout.blink_font_scale, TextAnchor.SW, 1.0)
+            wnd.draw_text(label, x, y,
+                          SSVEPLayout.blink_font_scale, TextAnchor.SW, 1.0)
 
-    for i, cue in SSVEPLayout.cues.items():
-        s, x, y, w, h = cue
-        x += 0.05
-        y += 0.05
+            if feedback_view.confidence is not None:
+                wnd.draw_rect(x, y-h*0.3, w*feedback_view.confidence[k], h*0.15, BLUE)
 
-        if i == this_i and t < SSVEPLayout.cue_length:
-            wnd.draw_rect(x-w*0.1, y-h*0.1, w *
-                          1.2, h*1.2, (1.0, 0, 0, 1.0))
+            if monitor is not None and freq in snr_labels.labels:
+                wnd.draw_text(snr_labels.labels[freq], x, y+h,
+                              SSVEPLayout.blink_font_scale, TextAnchor.SW, 1.0)
 
-        c = 0.0
-        wnd.draw_rect(x, y, w, h, (c, c, c, 1.0))
+    with wnd.profiler.scope('cues'):
+        for i, s, x, y, w, h in CUES:
+            if i == this_i and t < SSVEPLayout.cue_length:
+                wnd.draw_rect(x-w*0.1, y-h*0.1, w *
+                              1.2, h*1.2, RED)
 
-        wnd.draw_text(s, x, y, SSVEPLayout.cue_font_scale, TextAnchor.SW, 1.0)
+            wnd.draw_rect(x, y, w, h, BLACK)
+
+            wnd.draw_text(s, x, y, SSVEPLayout.cue_font_scale, TextAnchor.SW, 1.0)
 
     if not sw.running:
         t = sw.peek()
@@ -153,14 +423,94 @@ def main_render():
     return
 
 
+def operator_render():
+    '''
+    The operator screen, it shows the trial, the FPS of the displays and the SNR.
+    It is drawn on the stimulus thread, so the texts are cached like the SNR labels.
+    '''
+    operator_text.update(wnd.hud_timer.now())
+    wnd.draw_text(operator_text.trial, 0.05, 0.95, 0.5, TextAnchor.NW, 1.0)
+    for i, line in enumerate(operator_text.fps):
+        wnd.draw_text(line, 0.05, 0.9 - i * 0.05, 0.5, TextAnchor.NW, 1.0)
+
+    if monitor is not None:
+        snr_labels.update(monitor)
+        top = 0.85 - len(operator_text.fps) * 0.05
+        for i, line in enumerate(snr_labels.lines):
+            wnd.draw_text(line, 0.05, top - i * 0.05,
+                          0.5, TextAnchor.NW, 1.0)
+    return
+
+
 # %% ---- 2025-04-13 ------------------------
 # Play ground
 wnd = GLFWWindow()
-wnd.load_font('./font/msyh.ttc')
 
-Thread(target=performance_ruler, daemon=True).start()
 
-wnd.render_loop(key_callback, main_render)
+def on_frame(i, t):
+    sw.clock.tick()
+    feedback.on_swap()
+    trial.count_frame(t, wnd.refresh_rate)
+    if recorder is not None:
+        recorder.append_frame(t)
+
+
+def store_results(session: str):
+    '''
+    Store the finished trials into the results database in bulk.
+    The session without the decoder has no prediction, it is not stored.
+    '''
+    if not trial.results:
+        return
+    if decoder is None:
+        logger.info('No decoder in the session, the results are not stored.')
+        return
+    names = ('cue', 'freq', 'predicted', 'predicted_freq',
+             'decision_time', 'dropped_frames')
+    columns = dict(zip(names, zip(*trial.results)))
+    store = ResultsStore('data/results.sqlite')
+    try:
+        store.add_session(SUBJECT, session, SSVEPLayout, columns,
+                          refresh_rate=getattr(wnd, 'refresh_rate', None),
+                          path=recorder.path)
+    finally:
+        store.close()
+    return
+
+
+if __name__ == '__main__':
+    wnd.load_font('./font/msyh.ttc')
+
+    if TRCA_MODEL is not None:
+        decoder = TRCADecoder.load(TRCA_MODEL)
+
+    Thread(target=performance_ruler, daemon=True).start()
+    # The session runs without the socket feedback if the port is busy.
+    try:
+        FeedbackServer(feedback)
+    except OSError as e:
+        logger.warning(f'Feedback server is disabled: {e}')
+
+    os.makedirs('data', exist_ok=True)
+    session = datetime.now().strftime("%Y%m%d-%H%M%S")
+    recorder = SessionRecorder(f'data/session-{session}.ssrec')
+    recorder.write_meta({'layout': SSVEPLayout.to_dict()})
+
+    try:
+        extra_displays = None
+        if OPERATOR_MONITOR is not None:
+            extra_displays = [(OPERATOR_MONITOR, operator_render)]
+        wnd.render_loop(key_callback, main_render, on_frame=on_frame,
+                        extra_displays=extra_displays)
+    finally:
+        recorder.write_meta({'refresh_rate': getattr(wnd, 'refresh_rate', None),
+                             'frames': wnd.frame_count,
+                             'feedback_latency': feedback.reports})
+        recorder.close()
+        store_results(session)
+        if wnd.profiler.cursor > 0:
+            wnd.profiler.export_chrome_trace(
+                f'logs/trace-{datetime.now().strftime("%Y%m%d-%H%M%S")}.json')
 
 # %% ---- 2025-04-13 ------------------------
 # Pending
@@ -0,0 +1,149 @@
+"""
+File: replay.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Deterministic replay of the main_render with the virtual clock.
+
+    The compiled schedule is rendered frame by frame into the offscreen framebuffer,
+    as fast as the machine allows, the time of the frame i is i / refresh_rate.
+    The hash of every frame and the luminance at the center of every blink are saved,
+    so hours of the stimulus are regression-tested in seconds.
+    The frames are split into the segments and rendered across the processes.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import hashlib
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+from util.clock import VirtualClock
+from util.logging import logger
+from ssvep_design import SSVEPLayout, compile_schedule
+
+FONT_PATH = './font/msyh.ttc'
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+def replay_segment(start_frame: int, stop_frame: int, refresh_rate: float,
+                   width: int = 640, height: int = 480, font_path: str = FONT_PATH):
+    '''
+    Replay the frames [start_frame, stop_frame).
+
+    :return: The frame hashes (n_frames, ) and the luminance (n_frames, n_targets).
+    '''
+    # The main is imported here, so the worker processes have their own window and states.
+    import main
+
+    n_frames = stop_frame - start_frame
+    centers = np.array([
+        (int((y + 0.05 + h / 2) * height), int((x + 0.05 + w / 2) * width))
+        for _, x, y, w, h in SSVEPLayout.blinks.values()
+    ])
+    hashes = np.zeros(n_frames, dtype=np.uint64)
+    luminance = np.zeros((n_frames, len(centers)), dtype=np.float32)
+
+    clock = VirtualClock()
+    main.sw.clock = clock
+    main.sw.start()
+    total = SSVEPLayout.cue_length + SSVEPLayout.blink_length
+    main.trial.seek(start_frame / refresh_rate, total)
+
+    wnd = main.wnd
+    wnd.load_font(font_path)
+
+    def render():
+        clock.set((start_frame + wnd.frame_count) / refresh_rate)
+        main.main_render()
+
+    def on_frame(i, pixels):
+        digest = hashlib.blake2b(pixels, digest_size=8).digest()
+        hashes[i] = int.from_bytes(digest, 'little')
+        luminance[i] = pixels[centers[:, 0], centers[:, 1], 0] / 255.0
+
+    wnd.frame_count = 0
+    wnd.render_offscreen(render, n_frames, width, height, on_frame)
+    return hashes, luminance
+
+
+def replay(n_trials: int, refresh_rate: float, n_workers: int = 1, **kwargs):
+    '''
+    Replay the compiled schedule.
+
+    :param n_trials: The number of the trials.
+    :param refresh_rate: The virtual refresh rate (Hz).
+    :param n_workers: The number of the processes.
+
+    :return: The dict of the schedule, the frame times, the hashes and the luminance.
+    '''
+    schedule = compile_schedule(SSVEPLayout, n_trials)
+    n_frames = int(round(schedule['offset'][-1] * refresh_rate))
+    bounds = np.linspace(0, n_frames, n_workers + 1).astype(int)
+
+    if n_workers == 1:
+        results = [replay_segment(0, n_frames, refresh_rate, **kwargs)]
+    else:
+        with ProcessPoolExecutor(n_workers) as pool:
+            futures = [pool.submit(replay_segment, a, b, refresh_rate, **kwargs)
+                       for a, b in zip(bounds[:-1], bounds[1:])]
+            results = [f.result() for f in futures]
+
+    logger.info(
+        f'Replayed {n_trials} trials, {n_frames} frames at {refresh_rate} Hz')
+    return {
+        **{f'schedule_{k}': v for k, v in schedule.items()},
+        'times': np.arange(n_frames) / refresh_rate,
+        'hashes': np.concatenate([r[0] for r in results]),
+        'luminance': np.concatenate([r[1] for r in results]),
+        'targets': np.array(list(SSVEPLayout.blinks.keys())),
+    }
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Replay the stimulus offscreen.')
+    parser.add_argument('--trials', type=int, default=25)
+    parser.add_argument('--refresh-rate', type=float, default=120)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--output', default='replay.npz')
+    parser.add_argument('--reference', default=None,
+                        help='Compare the frame hashes with the previous output.')
+    args = parser.parse_args()
+
+    result = replay(args.trials, args.refresh_rate, args.workers)
+    np.savez(args.output, **result)
+    print(f'Saved {args.output}')
+
+    if args.reference:
+        reference = np.load(args.reference)['hashes']
+        if len(reference) != len(result['hashes']):
+            raise SystemExit(
+                f'Frame count differs from the reference: {len(reference)}')
+        diff = np.nonzero(reference != result['hashes'])[0]
+        if len(diff):
+            raise SystemExit(f'Frames differ from the reference: {diff[:10]}')
+        print('Frames match the reference.')
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
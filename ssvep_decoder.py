@@ -0,0 +1,309 @@
+"""
+File: ssvep_decoder.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Incremental CCA decoder with dynamic stopping.
+
+    The cross-covariance statistics between the EEG and the cached
+    sine-cosine reference signals are accumulated as the samples arrive,
+    so every update costs O(channels²) per sample instead of re-running
+    CCA on the growing window.
+    The decision is emitted once the confidence reaches the threshold,
+    and the render loop polls it to end the trial early.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import numpy as np
+
+from threading import Lock
+
+from ssvep_design import layout_freqs, merge_freqs
+from util.logging import logger
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+def make_reference_signals(freqs, srate: float, n_samples: int, n_harmonics: int = 5, onset: float = 0.0,
+                           max_freq: float = None):
+    '''
+    Make the sine-cosine reference signals.
+
+    :param freqs: The stimulus frequencies (Hz).
+    :param srate: The sampling rate (Hz).
+    :param n_samples: The length of the signals.
+    :param n_harmonics: The number of harmonics.
+    :param onset: The time (seconds) of the first sample.
+    :param max_freq: The harmonics at or above it are zeros, like the Nyquist frequency.
+
+    :return: The array in (n_samples, n_freqs, 2 x n_harmonics) shape.
+    '''
+    freqs = np.asarray(freqs, dtype=np.float64)
+    t = np.arange(n_samples) / srate + onset
+    h = np.arange(1, n_harmonics+1)
+    phase = 2 * np.pi * t[:, None, None] * freqs[None, :, None] * h
+    ref = np.concatenate([np.sin(phase), np.cos(phase)], axis=-1)
+    if max_freq is not None:
+        valid = freqs[:, None] * h < max_freq
+        ref *= np.concatenate([valid, valid], axis=-1)
+    return ref
+
+
+def margin_confidence(rho: np.ndarray):
+    '''
+    The confidence is the relative margin of the best correlation over the second best one.
+
+    :return: The index of the best one and the confidence.
+    '''
+    order = np.argsort(rho)[::-1]
+    best = rho[order[0]]
+    second = rho[order[1]] if len(order) > 1 else 0.0
+    return order[0], (1.0 - second / best if best > 0 else 0.0)
+
+
+class Decision:
+    '''
+    The decision of the decoder.
+
+    :param freq: The selected frequency.
+    :param targets: The blink ids with the selected frequency.
+    :param rho: The canonical correlations of all the frequencies.
+    :param confidence: The confidence of the decision.
+    :param duration: The data length (seconds) used for the decision.
+    '''
+
+    def __init__(self, freq, targets, rho, confidence, duration):
+        self.freq = freq
+        self.targets = targets
+        self.rho = rho
+        self.confidence = confidence
+        self.duration = duration
+
+    def __repr__(self):
+        return f'Decision(freq={self.freq}, targets={self.targets}, confidence={self.confidence:.3f}, duration={self.duration:.3f})'
+
+
+class DynamicStoppingDecoder:
+    '''
+    The CCA decoder works on the running covariance.
+
+    The samples are fed by update() from the acquisition thread,
+    and the render loop calls poll_decision() at every frame.
+    The reset() is called at the onset of the blink stage.
+
+    The confidence is the relative margin of the best correlation over the second best one,
+    the decision is made when it reaches the threshold,
+    or the max_length is reached.
+    '''
+
+    def __init__(self, freqs, srate: float, n_channels: int, targets=None, n_harmonics: int = 5,
+                 max_length: float = 2.0, min_length: float = 0.3, eval_interval: float = 0.05,
+                 threshold: float = 0.3, onset: float = 0.0, reg: float = 1e-6):
+        '''
+        :param freqs: The stimulus frequencies, the repeated ones are merged.
+        :param srate: The sampling rate (Hz).
+        :param n_channels: The number of the EEG channels.
+        :param targets: The target ids of every freqs, default is the indices.
+        :param n_harmonics: The number of harmonics of the reference signals,
+                            the harmonics at or above the Nyquist frequency are dropped.
+        :param max_length: The max data length (seconds), the decision is forced when it is reached.
+        :param min_length: The min data length (seconds) before the first decision.
+        :param eval_interval: The interval (seconds) of the evaluation.
+        :param threshold: The confidence threshold.
+        :param onset: The stimulus phase (seconds) at the first sample.
+        :param reg: The regularization of the covariance matrices.
+        '''
+        self.freqs, self.targets = merge_freqs(freqs, targets)
+        self.srate = srate
+        self.n_channels = n_channels
+        self.max_samples = int(max_length * srate)
+        self.min_samples = int(min_length * srate)
+        self.eval_samples = max(1, int(eval_interval * srate))
+        self.threshold = threshold
+        self.reg = reg
+
+        # The harmonics at or above the Nyquist frequency alias back into the band.
+        # They are dropped by the highest valid harmonic of the lowest frequency,
+        # and the ones of the higher frequencies are zeros, they are ignored by the CCA.
+        nyquist = srate / 2
+        if self.freqs[-1] >= nyquist:
+            raise ValueError(f'The frequency {self.freqs[-1]} Hz is above the Nyquist frequency {nyquist} Hz')
+        valid = int(np.ceil(nyquist / self.freqs[0])) - 1
+        if valid < n_harmonics:
+            logger.warning(
+                f'The harmonics are limited to {valid} below the Nyquist frequency {nyquist} Hz')
+            n_harmonics = valid
+        self.n_harmonics = n_harmonics
+
+        # The cached reference signals in (n_samples, n_freqs x n_dims) shape.
+        ref = make_reference_signals(
+            self.freqs, srate, self.max_samples, n_harmonics, onset, max_freq=nyquist)
+        self.n_dims = ref.shape[-1]
+        self.references = np.ascontiguousarray(
+            ref.reshape(self.max_samples, -1))
+
+        self.lock = Lock()
+        self.reset()
+        logger.info(
+            f'Decoder initialized with {len(self.freqs)} freqs, {n_channels} channels at {srate} Hz')
+
+    @classmethod
+    def from_layout(cls, layout, srate: float, n_channels: int, **kwargs):
+        '''
+        Make the decoder with the blinks of the layout, like the SSVEPLayout.
+
+        The max_length and the onset are the blink_length and the cue_length by default.
+        '''
+        kwargs.setdefault('max_length', layout.blink_length)
+        kwargs.setdefault('onset', layout.cue_length)
+        freqs, ids = layout_freqs(layout)
+        return cls(freqs, srate, n_channels, targets=ids, **kwargs)
+
+    def reset(self):
+        '''
+        Clear the statistics at the start of the trial.
+        '''
+        c = self.n_channels
+        k = len(self.freqs)
+        d = self.n_dims
+        with self.lock:
+            self.n = 0
+            self.next_eval = max(self.min_samples, self.eval_samples)
+            self.sx = np.zeros(c)
+            self.sy = np.zeros(k*d)
+            self.sxx = np.zeros((c, c))
+            self.sxy = np.zeros((c, k*d))
+            self.syy = np.zeros((k, d, d))
+            self.decision = None
+            self.decided = False
+        return
+
+    def update(self, chunk: np.ndarray):
+        '''
+        Accumulate the samples.
+
+        :param chunk: The samples in (n_samples, n_channels) shape.
+        '''
+        with self.lock:
+            if self.decided:
+                return
+
+            chunk = np.asarray(chunk, dtype=np.float64)
+            n = min(len(chunk), self.max_samples - self.n)
+            x = chunk[:n]
+            y = self.references[self.n:self.n+n]
+            yk = y.reshape(n, len(self.freqs), self.n_dims)
+
+            self.sx += x.sum(axis=0)
+            self.sy += y.sum(axis=0)
+            self.sxx += x.T @ x
+            self.sxy += x.T @ y
+            self.syy += np.einsum('nki,nkj->kij', yk, yk)
+            self.n += n
+
+            if self.n >= self.max_samples:
+                self._decide(force=True)
+            elif self.n >= self.next_eval:
+                # The chunk may span several evaluation points, they are evaluated once with the latest samples.
+                self.next_eval += ((self.n - self.next_eval) // self.eval_samples + 1) * self.eval_samples
+                self._decide(force=False)
+        return
+
+    def correlations(self):
+        '''
+        Compute the canonical correlations of all the freqs with the current statistics.
+
+        :return: The correlations in (n_freqs, ) shape.
+        '''
+        n = self.n
+        c = self.n_channels
+        k = len(self.freqs)
+        d = self.n_dims
+
+        mx = self.sx / n
+        my = (self.sy / n).reshape(k, d)
+
+        cxx = self.sxx / n - np.outer(mx, mx)
+        cxx += np.eye(c) * (self.reg * np.trace(cxx) / c + self.reg)
+        cxy = (self.sxy / n).reshape(c, k, d) - mx[:, None, None] * my
+        cyy = self.syy / n - my[:, :, None] * my[:, None, :]
+        cyy += np.eye(d) * self.reg
+
+        # Whiten both sides, the largest singular value is the correlation.
+        lx = np.linalg.cholesky(cxx)
+        ly = np.linalg.cholesky(cyy)
+        a = np.linalg.solve(lx, cxy.reshape(c, k*d))
+        a = a.reshape(c, k, d).transpose(1, 2, 0)
+        m = np.linalg.solve(ly, a)
+        return np.linalg.svd(m, compute_uv=False)[:, 0]
+
+    def _decide(self, force: bool):
+        rho = self.correlations()
+        i, confidence = margin_confidence(rho)
+
+        if not force and confidence < self.threshold:
+            return
+
+        self.decision = Decision(self.freqs[i], self.targets[i], rho,
+                                 confidence, self.n / self.srate)
+        self.decided = True
+        logger.debug(f'Decided: {self.decision}')
+        return
+
+    def finish(self):
+        '''
+        Force the decision with the samples so far, it is called when the blink stage times out.
+        The decision is fetched by the poll_decision(), nothing is decided without the samples.
+        '''
+        with self.lock:
+            if not self.decided and self.n > 0:
+                self._decide(force=True)
+        return
+
+    def poll_decision(self):
+        '''
+        Fetch the decision, it is only returned once.
+
+        :return: The Decision or None.
+        '''
+        with self.lock:
+            decision = self.decision
+            self.decision = None
+        return decision
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+if __name__ == "__main__":
+    from ssvep_design import SSVEPLayout
+
+    srate = 250
+    decoder = DynamicStoppingDecoder.from_layout(SSVEPLayout, srate, 8)
+    ref = make_reference_signals(
+        [SSVEPLayout.blinks[3][0]], srate, decoder.max_samples, 1, SSVEPLayout.cue_length)[:, 0, 0]
+    eeg = np.random.randn(decoder.max_samples, 8) + ref[:, None] * 0.5
+    for j in range(0, decoder.max_samples, 10):
+        decoder.update(eeg[j:j+10])
+        decision = decoder.poll_decision()
+        if decision:
+            print(decision)
+            break
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
@@ -18,9 +18,60 @@ Functions:
 
 # %% ---- 2025-04-11 ------------------------
 # Requirements and constants
+import numpy as np
+
 
 # %% ---- 2025-04-11 ------------------------
 # Function and class
+def blink_luminance(t, freq):
+    '''
+    The luminance (0, 1) of the blink at the time t (seconds).
+    '''
+    return np.cos(t * freq * 2 * np.pi) * 0.5 + 0.5
+
+
+def compile_schedule(layout, n_trials: int):
+    '''
+    Compile the fixed-length trials, the cues are shown in turn.
+
+    :return: The arrays of the trials, {'cue', 'onset', 'blink_onset', 'offset'}, in seconds.
+    '''
+    total = layout.cue_length + layout.blink_length
+    i = np.arange(n_trials)
+    return {
+        'cue': i % len(layout.cues) + 1,
+        'onset': i * total,
+        'blink_onset': i * total + layout.cue_length,
+        'offset': (i + 1) * total,
+    }
+
+
+def layout_freqs(layout):
+    '''
+    The frequencies and the ids of the blinks of the layout.
+
+    :return: The freqs and the ids, in the order of the blinks.
+    '''
+    ids = list(layout.blinks.keys())
+    return [layout.blinks[i][0] for i in ids], ids
+
+
+def merge_freqs(freqs, targets=None):
+    '''
+    Merge the repeated frequencies.
+
+    :param freqs: The frequencies of the targets.
+    :param targets: The target ids of every freqs, default is the indices.
+
+    :return: The unique freqs (sorted) and the tuple of the target ids of every unique freq.
+    '''
+    freqs = np.asarray(freqs, dtype=np.float64)
+    if targets is None:
+        targets = list(range(len(freqs)))
+    unique = np.unique(freqs)
+    return unique, [tuple(t for t, f in zip(targets, freqs) if f == u) for u in unique]
+
+
 class SSVEPLayout:
     cue_length = 1  # seconds
     cue_font_scale = 0.5
@@ -85,6 +136,18 @@ class SSVEPLayout:
         25: (34.8, 0.8, 0.85, 0.05, 0.05),
     }
 
+    @classmethod
+    def to_dict(cls):
+        '''
+        The layout as the json-friendly dict.
+        '''
+        return {
+            'cue_length': cls.cue_length,
+            'blink_length': cls.blink_length,
+            'cues': {str(k): list(v) for k, v in cls.cues.items()},
+            'blinks': {str(k): list(v) for k, v in cls.blinks.items()},
+        }
+
 
 # %% ---- 2025-04-11 ------------------------
 # Play ground
@@ -0,0 +1,212 @@
+"""
+File: ssvep_epochs.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Epoch extraction from the continuous recordings and the marker logs.
+
+    The markers are the cue index and the onset frame of every trial.
+    The epochs are the strided views of the continuous EEG,
+    they are built in one shot without looping over the markers.
+    The onsets are corrected by the frame log when it is available,
+    and the trials overlapping the dropped frames or the buffer overruns are rejected.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import numpy as np
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+from util.logging import logger
+
+# The frame interval longer than this factor of the nominal interval is a dropped frame.
+DROPPED_FRAME_FACTOR = 1.5
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+def find_dropped_frames(frame_times: np.ndarray, refresh_rate: float):
+    '''
+    Find the dropped frames in the frame log.
+
+    :param frame_times: The timestamps (seconds) of the frames.
+    :param refresh_rate: The nominal refresh rate (Hz).
+
+    :return: The boolean mask of the frames, the frame is True if it is shown late.
+    '''
+    dropped = np.zeros(len(frame_times), dtype=bool)
+    dropped[1:] = np.diff(frame_times) > DROPPED_FRAME_FACTOR / refresh_rate
+    return dropped
+
+
+def _count_in_spans(mask: np.ndarray, starts: np.ndarray, stops: np.ndarray):
+    '''
+    Count the True values of the mask in every [start, stop) span.
+    '''
+    cumsum = np.concatenate([[0], np.cumsum(mask, dtype=np.int64)])
+    starts = np.clip(starts, 0, len(mask))
+    stops = np.clip(stops, 0, len(mask))
+    return cumsum[stops] - cumsum[starts]
+
+
+class Epochs:
+    '''
+    The epochs of the continuous EEG.
+
+    The windows is the sliding window view of the EEG, (n_windows, n_channels, n_samples),
+    every epoch is the window at its start sample, so indexing a single epoch does not copy.
+
+    - cues: The cue indices of the trials.
+    - starts: The start samples of the trials.
+    - accepted: The boolean mask of the accepted trials.
+    - reasons: The rejection reasons of the trials, '' for the accepted ones.
+    '''
+
+    def __init__(self, windows, cues, starts, accepted, reasons, srate):
+        self.windows = windows
+        self.cues = cues
+        self.starts = starts
+        self.accepted = accepted
+        self.reasons = reasons
+        self.srate = srate
+
+    def __len__(self):
+        return len(self.cues)
+
+    def __getitem__(self, i):
+        '''
+        Get the i-th epoch as the view, (n_channels, n_samples).
+        '''
+        return self.windows[self.starts[i]]
+
+    def to_array(self, only_accepted: bool = True):
+        '''
+        Gather the epochs into the array, (n_trials, n_channels, n_samples).
+        It is the only copy of the data.
+        '''
+        starts = self.starts[self.accepted] if only_accepted else self.starts
+        return self.windows[starts]
+
+    def to_blocks(self):
+        '''
+        Arrange the accepted epochs into (n_targets, n_blocks, n_channels, n_samples),
+        the blocks are trimmed to the target with the fewest accepted trials.
+
+        :return: The array and the cue indices of the targets.
+        :raises ValueError: If no epoch is accepted.
+        '''
+        if not self.accepted.any():
+            raise ValueError('No accepted epochs to arrange into blocks')
+        cues = self.cues[self.accepted]
+        starts = self.starts[self.accepted]
+        targets, counts = np.unique(cues, return_counts=True)
+        n_blocks = counts.min()
+
+        # Sort by cue and keep the first n_blocks trials of every target.
+        order = np.argsort(cues, kind='stable')
+        first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        index = order[(first[:, None] + np.arange(n_blocks)).ravel()]
+        array = self.windows[starts[index]]
+        return array.reshape(len(targets), n_blocks, *array.shape[1:]), targets
+
+
+def extract_epochs(eeg: np.ndarray, srate: float, cues, onset_frames, refresh_rate: float,
+                   length: float, tmin: float = 0.0, frame_times: np.ndarray = None,
+                   eeg_t0: float = 0.0, latency: float = 0.0, bad_samples: np.ndarray = None):
+    '''
+    Extract the epochs.
+
+    Without the frame_times, the onset is the onset_frame / refresh_rate seconds after the eeg_t0.
+    With the frame_times, the onset is the timestamp of the onset_frame,
+    and the trials overlapping the dropped frames are rejected.
+
+    :param eeg: The continuous EEG, (n_samples, n_channels).
+    :param srate: The sampling rate (Hz).
+    :param cues: The cue indices of the trials.
+    :param onset_frames: The onset frames of the trials.
+    :param refresh_rate: The nominal refresh rate (Hz).
+    :param length: The length (seconds) of the epochs.
+    :param tmin: The start (seconds) of the epochs relative to the onsets.
+    :param frame_times: The timestamps (seconds) of the frames, in the same clock of the eeg_t0.
+    :param eeg_t0: The timestamp (seconds) of the first EEG sample.
+    :param latency: The constant latency (seconds) from the frame to the EEG, like the photodiode delay.
+    :param bad_samples: The boolean mask of the EEG samples, True for the buffer overruns or the gaps.
+
+    :return: The Epochs.
+    '''
+    cues = np.asarray(cues)
+    onset_frames = np.asarray(onset_frames, dtype=np.int64)
+    n_samples = int(round(length * srate))
+    n_trials = len(cues)
+
+    windows = sliding_window_view(eeg, n_samples, axis=0)
+    n_windows = windows.shape[0]
+
+    reasons = np.full(n_trials, '', dtype=object)
+
+    if frame_times is None:
+        onsets = onset_frames / refresh_rate
+    else:
+        frame_times = np.asarray(frame_times, dtype=np.float64)
+        valid = (onset_frames >= 0) & (onset_frames < len(frame_times))
+        onsets = np.full(n_trials, np.nan)
+        onsets[valid] = frame_times[onset_frames[valid]]
+        reasons[~valid] = 'frame out of log'
+
+        # The frames covered by the epochs.
+        dropped = find_dropped_frames(frame_times, refresh_rate)
+        first = onset_frames + int(np.floor(tmin * refresh_rate))
+        last = onset_frames + int(np.ceil((tmin + length) * refresh_rate)) + 1
+        hit = _count_in_spans(dropped, first, last) > 0
+        reasons[hit & (reasons == '')] = 'dropped frames'
+
+    starts = np.round((onsets - eeg_t0 + latency + tmin) * srate)
+    outside = ~np.isfinite(starts) | (starts < 0) | (starts >= n_windows)
+    reasons[outside & (reasons == '')] = 'out of recording'
+    starts = np.where(outside, 0, starts).astype(np.int64)
+
+    if bad_samples is not None:
+        hit = _count_in_spans(bad_samples, starts, starts + n_samples) > 0
+        reasons[hit & ~outside & (reasons == '')] = 'buffer overrun'
+
+    accepted = reasons == ''
+    logger.info(
+        f'Extracted {accepted.sum()} / {n_trials} epochs ({n_samples} samples)')
+    return Epochs(windows, cues, starts, accepted, reasons, srate)
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+if __name__ == "__main__":
+    srate = 250
+    refresh_rate = 60
+    eeg = np.random.randn(srate * 60, 8)
+    onset_frames = np.arange(20) * refresh_rate * 3
+    cues = np.arange(20) % 5 + 1
+
+    frame_times = np.arange(refresh_rate * 60) / refresh_rate
+    frame_times[400:] += 0.05
+    epochs = extract_epochs(eeg, srate, cues, onset_frames, refresh_rate, 2.0,
+                            frame_times=frame_times)
+    print(epochs.reasons)
+    print(epochs.to_array().shape, np.shares_memory(epochs[0], eeg))
+    print(epochs.to_blocks()[0].shape)
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
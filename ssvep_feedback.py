@@ -0,0 +1,286 @@
+"""
+File: ssvep_feedback.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Decoder-to-render feedback channel.
+
+    The decoder posts "targets k, ... selected" or the confidence vector,
+    the targets sharing the decoded frequency are selected together.
+    from the thread directly, or from the other process by the local UDP socket.
+    The message is kept in the single slot, the posting replaces it,
+    and the render loop picks it up at the frame start without locking.
+    The latency from the posting to the swap of the frame showing it is recorded,
+    and it is reported per trial.
+
+    The message of the socket is the json, like
+        {"target": 3}
+        {"target": [1, 8, 15, 22]}
+        {"confidence": [0.1, 0.7, ...]}
+    with the optional "t" of the time.perf_counter() of the sender on the same machine.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import json
+import time
+import socket
+import itertools
+import numpy as np
+
+from threading import Thread
+
+from util.logging import logger
+
+FEEDBACK_PORT = 16150
+
+# The kinds of the messages.
+SELECTION = 'selection'
+CONFIDENCE = 'confidence'
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+class FeedbackMessage:
+    __slots__ = ('seq', 'kind', 'targets', 'confidence', 't_post')
+
+    def __init__(self, seq: int, kind: str, targets: tuple, confidence: np.ndarray, t_post: float):
+        self.seq = seq
+        self.kind = kind
+        self.targets = targets
+        self.confidence = confidence
+        self.t_post = t_post
+
+
+def _check_targets(targets):
+    '''
+    The targets are the integer or the non-empty sequence of the integers,
+    the bool and the float are rejected.
+
+    :return: The tuple of the targets.
+    '''
+    if isinstance(targets, (int, np.integer)):
+        targets = (targets,)
+    if not isinstance(targets, (list, tuple)) or not targets:
+        raise ValueError(f'Invalid targets: {str(targets)[:64]}')
+    for target in targets:
+        if isinstance(target, (bool, np.bool_)) or not isinstance(target, (int, np.integer)):
+            raise ValueError(f'Invalid target: {target!r}')
+    return tuple(int(t) for t in targets)
+
+
+def _check_time(t):
+    '''
+    The time is the finite number, it is now if None.
+    '''
+    if t is None:
+        return time.perf_counter()
+    if isinstance(t, (bool, np.bool_)) or not isinstance(t, (int, float, np.integer, np.floating)):
+        raise ValueError(f'Invalid time: {t!r}')
+    t = float(t)
+    if not np.isfinite(t):
+        raise ValueError(f'Invalid time: {t!r}')
+    return t
+
+
+def _check_confidence(confidence, n_targets: int = None):
+    '''
+    The confidence is the 1-D finite float vector, in the length of n_targets if it is given.
+    '''
+    try:
+        confidence = np.array(confidence, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid confidence: {str(confidence)[:64]}')
+    if confidence.ndim != 1 or not np.isfinite(confidence).all():
+        raise ValueError(f'Invalid confidence of shape {confidence.shape}')
+    if n_targets is not None and len(confidence) != n_targets:
+        raise ValueError(f'Confidence of {len(confidence)} targets, expect {n_targets}')
+    return confidence
+
+
+class FeedbackChannel:
+    '''
+    The single-slot feedback channel.
+
+    The slot is replaced by a single attribute assignment, which is atomic in CPython,
+    so neither the posting threads nor the render loop take the lock.
+    Only the latest message is shown, the older ones are replaced.
+    The messages are validated by the posting thread,
+    so the render loop only sees the valid ones.
+    '''
+
+    def __init__(self, n_targets: int = None):
+        '''
+        :param n_targets: The length of the confidence vector, it is not checked if None.
+        '''
+        self.n_targets = n_targets
+        self.slot = None
+        self.counter = itertools.count(1)
+        self.seen = 0
+
+        # The message picked up in the current frame, it is timed at the swap.
+        self.picked = None
+        self.t_pick = 0.0
+
+        # The (post to pick, post to swap) latencies (seconds) of the current trial,
+        # and the per-trial reports.
+        self.latencies = []
+        self.reports = []
+
+    def post_selection(self, targets, t_post: float = None):
+        '''
+        Post the selected targets, it is called by the decoder,
+        like the Decision.targets of the decoded frequency.
+
+        :raises ValueError: If the targets or the t_post is invalid, the message is dropped.
+        '''
+        self.slot = FeedbackMessage(next(self.counter), SELECTION, _check_targets(targets), None,
+                                    _check_time(t_post))
+        return
+
+    def post_confidence(self, confidence, t_post: float = None):
+        '''
+        Post the confidence vector of the targets, it is called by the decoder.
+
+        :raises ValueError: If the confidence or the t_post is invalid, the message is dropped.
+        '''
+        self.slot = FeedbackMessage(next(self.counter), CONFIDENCE, None,
+                                    _check_confidence(confidence, self.n_targets),
+                                    _check_time(t_post))
+        return
+
+    def poll(self):
+        '''
+        Pick up the new message at the frame start, it is called by the render loop.
+
+        :return: The new FeedbackMessage or None.
+        '''
+        message = self.slot
+        if message is None or message.seq == self.seen:
+            return None
+        self.seen = message.seq
+        self.picked = message
+        self.t_pick = time.perf_counter()
+        return message
+
+    def on_swap(self):
+        '''
+        Time the picked message after the frame is swapped, it is called by the render loop.
+        '''
+        message = self.picked
+        if message is None:
+            return
+        self.picked = None
+        self.latencies.append(
+            (self.t_pick - message.t_post, time.perf_counter() - message.t_post))
+        return
+
+    def report_trial(self, trial: int):
+        '''
+        Summarize the latencies (milliseconds) of the trial and start the next one.
+
+        :return: The report, or None if there is no feedback in the trial.
+        '''
+        if not self.latencies:
+            return None
+        lat = np.array(self.latencies) * 1000
+        self.latencies = []
+        report = {
+            'trial': trial,
+            'n': len(lat),
+            'pick_mean': float(lat[:, 0].mean()),
+            'swap_mean': float(lat[:, 1].mean()),
+            'swap_max': float(lat[:, 1].max()),
+        }
+        self.reports.append(report)
+        logger.info(
+            f'Trial {trial} feedback latency: {report["swap_mean"]:.2f} ms (max {report["swap_max"]:.2f} ms, n={report["n"]})')
+        return report
+
+
+class FeedbackServer:
+    '''
+    Receive the messages from the local UDP socket, and post them to the channel.
+    '''
+
+    def __init__(self, channel: FeedbackChannel, host: str = '127.0.0.1', port: int = FEEDBACK_PORT):
+        self.channel = channel
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.sock.bind((host, port))
+        except OSError:
+            self.sock.close()
+            raise
+        self.thread = Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        logger.info(f'Feedback server listening on {host}:{port}')
+
+    def _loop(self):
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(65536)
+            except OSError:
+                break
+            t = time.perf_counter()
+            # Drop the invalid packets here, they never reach the render loop.
+            try:
+                message = json.loads(data)
+                if not isinstance(message, dict):
+                    raise ValueError('Not an object')
+                t_post = message.get('t', t)
+                if 'target' in message:
+                    self.channel.post_selection(message['target'], t_post)
+                elif 'confidence' in message:
+                    self.channel.post_confidence(message['confidence'], t_post)
+                else:
+                    raise ValueError('Neither target nor confidence')
+            except Exception as e:
+                logger.warning(f'Invalid feedback message: {data[:64]}, {e}')
+        return
+
+    def close(self):
+        self.sock.close()
+        return
+
+
+def send_feedback(target=None, confidence=None, host: str = '127.0.0.1', port: int = FEEDBACK_PORT):
+    '''
+    Send the feedback from the other process.
+
+    :param target: The selected target, or the list of them.
+    '''
+    message = {'t': time.perf_counter()}
+    if target is not None:
+        message['target'] = [int(t) for t in np.atleast_1d(target)]
+    else:
+        message['confidence'] = [float(c) for c in confidence]
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(json.dumps(message).encode('utf-8'), (host, port))
+    return
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+if __name__ == "__main__":
+    import sys
+
+    # Usage: python ssvep_feedback.py 3
+    send_feedback(int(sys.argv[1]) if len(sys.argv) > 1 else 1)
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
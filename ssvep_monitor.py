@@ -0,0 +1,184 @@
+"""
+File: ssvep_monitor.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Live SSVEP spectrum monitor with the sliding DFT.
+
+    Every (channel, frequency, harmonic) bin and its neighbouring noise bins
+    are kept as the sliding DFT over the window,
+    the incoming sample is added and the outgoing sample is removed,
+    so the update is O(1) per sample per bin, and it is vectorized over the chunk.
+    The SNR of every target is published at a few Hz,
+    for the GLFWWindow HUD or the separate process by the on_publish callback.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import numpy as np
+
+from ssvep_design import layout_freqs, merge_freqs
+from util.logging import logger
+
+# The interval (seconds) of recomputing the DFT from the window, to drop the accumulated rounding error.
+REFRESH_INTERVAL = 10.0
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+class SpectrumMonitor:
+    '''
+    The sliding-DFT monitor.
+
+    The update() is called by the acquisition thread,
+    the snr and the version are replaced on every publish,
+    so the render loop reads them without locking.
+    '''
+
+    def __init__(self, freqs, srate: float, n_channels: int, targets=None, window: float = 2.0,
+                 n_harmonics: int = 2, n_noise: int = 3, noise_step: float = 0.5,
+                 publish_rate: float = 4.0, on_publish: callable = None):
+        '''
+        :param freqs: The stimulus frequencies, the repeated ones are merged.
+        :param srate: The sampling rate (Hz).
+        :param n_channels: The number of the channels.
+        :param targets: The target ids of every freqs, default is the indices.
+        :param window: The window length (seconds).
+        :param n_harmonics: The number of harmonics.
+        :param n_noise: The number of the noise bins on each side.
+        :param noise_step: The spacing (Hz) of the noise bins.
+        :param publish_rate: The publish rate (Hz).
+        :param on_publish: Called with the snr (dB) of the freqs on every publish.
+        '''
+        self.freqs, self.targets = merge_freqs(freqs, targets)
+        self.srate = srate
+        self.n_channels = n_channels
+        self.n_window = int(window * srate)
+        self.n_harmonics = n_harmonics
+        self.n_noise = n_noise
+
+        # The bins in (n_freqs, n_harmonics, 1 + 2 x n_noise), the first one is the signal.
+        offsets = np.concatenate(
+            [[0], np.arange(1, n_noise+1), -np.arange(1, n_noise+1)]) * noise_step
+        bins = (self.freqs[:, None, None] * np.arange(1, n_harmonics+1)[:, None]
+                + offsets)
+        self.bins = bins
+        self.omega = 2 * np.pi * bins.ravel() / srate
+        # The phasor of the outgoing sample relative to the incoming one.
+        self.outgoing = np.exp(1j * self.omega * self.n_window)
+
+        self.publish_samples = max(1, int(srate / publish_rate))
+        self.refresh_samples = int(REFRESH_INTERVAL * srate)
+        self.on_publish = on_publish
+        self.reset()
+        logger.info(
+            f'Spectrum monitor: {len(self.freqs)} freqs x {n_harmonics} harmonics, {self.omega.size} bins')
+
+    @classmethod
+    def from_layout(cls, layout, srate: float, n_channels: int, **kwargs):
+        freqs, ids = layout_freqs(layout)
+        return cls(freqs, srate, n_channels, targets=ids, **kwargs)
+
+    def reset(self):
+        self.n = 0
+        self.ring = np.zeros((self.n_window, self.n_channels))
+        self.dft = np.zeros((self.n_channels, self.omega.size), dtype=np.complex128)
+        self.next_publish = self.publish_samples
+        self.next_refresh = self.refresh_samples
+        self.snr = np.zeros(len(self.freqs))
+        self.version = 0
+        return
+
+    def _phasors(self, m: np.ndarray):
+        return np.exp(-1j * np.outer(m, self.omega))
+
+    def update(self, chunk: np.ndarray):
+        '''
+        Slide the DFT with the samples, (n_samples, n_channels).
+        '''
+        chunk = np.asarray(chunk, dtype=np.float64)
+        for i in range(0, len(chunk), self.n_window):
+            self._slide(chunk[i:i+self.n_window])
+        return
+
+    def _slide(self, x: np.ndarray):
+        m = self.n + np.arange(len(x))
+        pos = m % self.n_window
+        e = self._phasors(m)
+
+        # The slot of the sample m holds the outgoing sample m - n_window.
+        self.dft += x.T @ e - self.ring[pos].T @ (e * self.outgoing)
+        self.ring[pos] = x
+        self.n += len(x)
+
+        # The chunk may span several intervals, they are caught up once with the latest samples.
+        if self.n >= self.next_refresh:
+            self.next_refresh += ((self.n - self.next_refresh) // self.refresh_samples + 1) * self.refresh_samples
+            self._refresh()
+
+        if self.n >= self.next_publish:
+            self.next_publish += ((self.n - self.next_publish) // self.publish_samples + 1) * self.publish_samples
+            self._publish()
+        return
+
+    def _refresh(self):
+        '''
+        Recompute the DFT from the window.
+        '''
+        m = np.arange(self.n - self.n_window, self.n)
+        self.dft = self.ring[m % self.n_window].T @ self._phasors(m)
+        return
+
+    def _publish(self):
+        power = np.abs(self.dft) ** 2
+        power = power.reshape(self.n_channels, *self.bins.shape)
+        signal = power[..., 0].sum(axis=-1)
+        noise = power[..., 1:].mean(axis=-1).sum(axis=-1)
+        ratio = (signal / np.maximum(noise, 1e-20)).mean(axis=0)
+
+        self.snr = 10 * np.log10(np.maximum(ratio, 1e-20))
+        self.version += 1
+        if self.on_publish is not None:
+            self.on_publish(self.snr)
+        return
+
+    def target_snr(self):
+        '''
+        The latest snr (dB) of the targets, {target: snr}.
+        '''
+        snr = self.snr
+        return {t: snr[i] for i, ts in enumerate(self.targets) for t in ts}
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+if __name__ == "__main__":
+    from ssvep_design import SSVEPLayout
+    from ssvep_synthetic import SyntheticEEG
+
+    srate = 1000
+    generator = SyntheticEEG(SSVEPLayout, srate=srate, n_channels=32, n_trials=3, seed=0)
+    monitor = SpectrumMonitor.from_layout(SSVEPLayout, srate, 32)
+    while generator.sample < generator.duration * srate:
+        chunk, t0 = generator.next_chunk(20)
+        monitor.update(chunk)
+        if monitor.n % srate == 0:
+            print(f'{t0:.1f} s', np.round(monitor.snr, 1))
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
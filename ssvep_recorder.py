@@ -0,0 +1,428 @@
+"""
+File: ssvep_recorder.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Chunked and indexed binary session recording.
+
+    The EEG, the markers, the frame log and the meta (layout and schedule)
+    are appended into one file as the chunks.
+    The rows are buffered into the fixed-size blocks,
+    and the full blocks are written by the background thread.
+    The trailing index is written on close,
+    the file is scanned chunk by chunk if the index is missing (like crashed).
+
+    File layout:
+        [file header (64 bytes)]
+        [chunk header (64 bytes)][payload (aligned to 64 bytes)] ...
+        [index (json)][footer]
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import json
+import queue
+import struct
+import time
+import collections
+import numpy as np
+
+from threading import Thread, Lock
+
+from util.binary import aligned
+from util.logging import logger
+
+RECORD_MAGIC = b'SSVEPREC'
+RECORD_VERSION = 1
+RECORD_ALIGN = 64
+
+# magic, version
+FILE_HEADER = struct.Struct('<8sI')
+# magic, stream, dtype, n_rows, n_cols, first_row, payload_nbytes
+CHUNK_HEADER = struct.Struct('<4s16s8sQQQQ')
+CHUNK_MAGIC = b'CHNK'
+# magic, index offset, index nbytes, file magic
+FOOTER = struct.Struct('<4sQQ8s')
+FOOTER_MAGIC = b'INDX'
+
+# The streams of the session, (dtype, rows per chunk).
+# The markers are (cue, onset frame, eeg sample), the frames are the timestamps.
+# Every meta is written as one chunk of the json bytes.
+STREAMS = {
+    'eeg': ('<f4', 8192),
+    'markers': ('<i8', 256),
+    'frames': ('<f8', 4096),
+    'meta': ('u1', None),
+}
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+class _StreamBuffer:
+    '''
+    The block buffer of one stream, the block is handed to the writer when it is full.
+    '''
+
+    def __init__(self, name: str, dtype: str, n_cols: int, chunk_rows: int):
+        self.name = name
+        self.dtype = dtype
+        self.n_cols = n_cols
+        self.chunk_rows = chunk_rows
+        self.block = np.empty((chunk_rows, n_cols), dtype=dtype)
+        self.filled = 0
+        self.rows = 0
+        # The total rows of the finished appends, it is replaced in one assignment,
+        # so the other threads read it without the lock,
+        # the rows and the filled are inconsistent while the block is popped.
+        self.total = 0
+        self.lock = Lock()
+
+    def append(self, rows: np.ndarray, flush: callable):
+        with self.lock:
+            i = 0
+            while i < len(rows):
+                n = min(len(rows) - i, self.chunk_rows - self.filled)
+                self.block[self.filled:self.filled+n] = rows[i:i+n]
+                self.filled += n
+                i += n
+                if self.filled == self.chunk_rows:
+                    self.pop(flush)
+            self.total = self.rows + self.filled
+        return
+
+    def pop(self, flush: callable):
+        if self.filled == 0:
+            return
+        block = self.block[:self.filled]
+        flush(self.name, block, self.rows)
+        self.rows += self.filled
+        self.block = np.empty((self.chunk_rows, self.n_cols), dtype=self.dtype)
+        self.filled = 0
+        return
+
+
+class SessionRecorder:
+    '''
+    The session recorder.
+
+    The append_* methods are safe to call from the acquisition and the render threads.
+    The memory use of the EEG is bounded by the blocks and the writer queue.
+    The render thread never waits for the writer,
+    the markers and the frames go to the overflow if the queue is full,
+    and the writer drains it after the next queued block.
+    '''
+
+    def __init__(self, path, max_pending: int = 16):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(FILE_HEADER.pack(RECORD_MAGIC, RECORD_VERSION))
+        self.file.write(b'\0' * (RECORD_ALIGN - FILE_HEADER.size))
+
+        self.buffers = {}
+        self.index = {}
+        self.meta = {}
+        self.lock = Lock()
+        self.closed = False
+
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.overflow = collections.deque()
+        self.overflows = 0
+        self.writer = Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+        logger.info(f'Recording session: {path}')
+
+    def _buffer(self, name: str, n_cols: int):
+        buffer = self.buffers.get(name)
+        if buffer is None:
+            with self.lock:
+                buffer = self.buffers.get(name)
+                if buffer is None:
+                    dtype, chunk_rows = STREAMS[name]
+                    buffer = _StreamBuffer(name, dtype, n_cols, chunk_rows)
+                    self.buffers[name] = buffer
+        if buffer.n_cols != n_cols:
+            raise ValueError(
+                f'Stream {name} has {buffer.n_cols} columns, got {n_cols}')
+        return buffer
+
+    def _flush(self, name: str, block: np.ndarray, first_row: int):
+        # Blocks if the writer falls behind, so the memory does not grow.
+        self.pending.put((name, block, first_row))
+
+    def _flush_nowait(self, name: str, block: np.ndarray, first_row: int):
+        # The render thread does not wait, the small blocks go to the overflow if the queue is full.
+        try:
+            self.pending.put_nowait((name, block, first_row))
+        except queue.Full:
+            self.overflow.append((name, block, first_row))
+            self.overflows += 1
+
+    def _write_loop(self):
+        while True:
+            item = self.pending.get()
+            if item is not None:
+                self._write(*item)
+            while self.overflow:
+                self._write(*self.overflow.popleft())
+            if item is None:
+                break
+        return
+
+    def _write(self, name: str, block: np.ndarray, first_row: int):
+        offset = self.file.tell()
+        data = np.ascontiguousarray(block).tobytes()
+        self.file.write(CHUNK_HEADER.pack(
+            CHUNK_MAGIC, name.encode(), block.dtype.str.encode(),
+            block.shape[0], block.shape[1], first_row, len(data)))
+        self.file.write(b'\0' * (RECORD_ALIGN - CHUNK_HEADER.size))
+        self.file.write(data)
+        self.file.write(b'\0' * (aligned(len(data), RECORD_ALIGN) - len(data)))
+
+        entry = self.index.setdefault(name, {
+            'dtype': block.dtype.str,
+            'n_cols': block.shape[1],
+            'chunk_rows': STREAMS[name][1],
+            'chunks': [],
+        })
+        entry['chunks'].append(
+            [offset + RECORD_ALIGN, first_row, block.shape[0]])
+        return
+
+    def append_eeg(self, chunk: np.ndarray, timestamp: float = None):
+        '''
+        Append the EEG samples, (n_samples, n_channels).
+
+        :param timestamp: The time.time() of the first sample of the chunk,
+                          the one of the first chunk is the eeg_t0 of the meta, default is now.
+                          It is the same clock of the frame timestamps,
+                          so the epochs are extracted with the frame_times and the eeg_t0.
+        '''
+        chunk = np.asarray(chunk)
+        buffer = self._buffer('eeg', chunk.shape[1])
+        if 'eeg_t0' not in self.meta:
+            self.write_meta({'eeg_t0': time.time() if timestamp is None else float(timestamp)})
+        buffer.append(chunk, self._flush)
+        return
+
+    def append_marker(self, cue: int, onset_frame: int):
+        '''
+        Append the trial marker, the current EEG sample is recorded with it.
+        The render thread does not wait for the eeg lock, which is held while the writer queue is full.
+        '''
+        eeg = self.buffers.get('eeg')
+        sample = 0 if eeg is None else eeg.total
+        row = np.array([[cue, onset_frame, sample]])
+        self._buffer('markers', 3).append(row, self._flush_nowait)
+        return
+
+    def append_frame(self, timestamp: float):
+        '''
+        Append the timestamp of the frame, it is called once per frame.
+        '''
+        buffer = self._buffer('frames', 1)
+        with buffer.lock:
+            buffer.block[buffer.filled, 0] = timestamp
+            buffer.filled += 1
+            if buffer.filled == buffer.chunk_rows:
+                buffer.pop(self._flush_nowait)
+            buffer.total = buffer.rows + buffer.filled
+        return
+
+    def write_meta(self, meta: dict):
+        '''
+        Write the meta, like the layout and the schedule.
+        It is also kept in the index.
+        '''
+        self.meta.update(meta)
+        data = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype='u1')
+        self._flush('meta', data[:, None], 0)
+        return
+
+    def close(self):
+        '''
+        Flush the buffers, write the index and close the file.
+        '''
+        if self.closed:
+            return
+        self.closed = True
+
+        for buffer in list(self.buffers.values()):
+            with buffer.lock:
+                buffer.pop(self._flush)
+        self.pending.put(None)
+        self.writer.join()
+        if self.overflows:
+            logger.warning(f'The writer queue overflowed {self.overflows} times, the disk is slow')
+
+        offset = self.file.tell()
+        data = json.dumps({'streams': self.index, 'meta': self.meta}).encode('utf-8')
+        self.file.write(data)
+        self.file.write(FOOTER.pack(FOOTER_MAGIC, offset, len(data), RECORD_MAGIC))
+        self.file.close()
+        logger.info(f'Session recorded: {self.path}')
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SessionReader:
+    '''
+    The session reader, the chunks are memory-mapped when they are read.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+            if magic != RECORD_MAGIC:
+                raise ValueError(f'Not a session file: {path}')
+            if version != RECORD_VERSION:
+                raise ValueError(f'Unsupported session version: {version}')
+
+            f.seek(0, 2)
+            size = f.tell()
+            footer = None
+            if size >= RECORD_ALIGN + FOOTER.size:
+                f.seek(size - FOOTER.size)
+                footer = FOOTER.unpack(f.read(FOOTER.size))
+
+            if footer and footer[0] == FOOTER_MAGIC and footer[3] == RECORD_MAGIC:
+                f.seek(footer[1])
+                index = json.loads(f.read(footer[2]).decode('utf-8'))
+                self.streams = index['streams']
+                self.meta = index['meta']
+            else:
+                logger.warning(f'Index is missing, scanning: {path}')
+                self.streams = self._scan(f, size)
+                self.meta = {}
+                for data in self._chunks('meta'):
+                    self.meta.update(json.loads(bytes(data[:, 0])))
+
+        self.markers = self.read('markers')
+        logger.info(f'Opened session: {path}')
+
+    @staticmethod
+    def _scan(f, size):
+        streams = {}
+        offset = RECORD_ALIGN
+        while offset + RECORD_ALIGN <= size:
+            f.seek(offset)
+            magic, name, dtype, n_rows, n_cols, first_row, nbytes = CHUNK_HEADER.unpack(
+                f.read(CHUNK_HEADER.size))
+            if magic != CHUNK_MAGIC or offset + RECORD_ALIGN + nbytes > size:
+                break
+            name = name.rstrip(b'\0').decode()
+            entry = streams.setdefault(name, {
+                'dtype': dtype.rstrip(b'\0').decode(),
+                'n_cols': n_cols,
+                'chunk_rows': STREAMS[name][1],
+                'chunks': [],
+            })
+            entry['chunks'].append([offset + RECORD_ALIGN, first_row, n_rows])
+            offset += RECORD_ALIGN + aligned(nbytes, RECORD_ALIGN)
+        return streams
+
+    def _map(self, entry, chunk):
+        offset, _, n_rows = chunk
+        return np.memmap(self.path, dtype=entry['dtype'], mode='r',
+                         offset=offset, shape=(n_rows, entry['n_cols']))
+
+    def _chunks(self, name):
+        entry = self.streams.get(name)
+        if entry is None:
+            return []
+        return [self._map(entry, c) for c in entry['chunks']]
+
+    def n_rows(self, name):
+        entry = self.streams.get(name)
+        if entry is None or not entry['chunks']:
+            return 0
+        _, first_row, n_rows = entry['chunks'][-1]
+        return first_row + n_rows
+
+    def read(self, name, start: int = 0, stop: int = None):
+        '''
+        Read the rows [start, stop) of the stream.
+
+        The chunks have the same rows except the last one,
+        so the chunks are located without searching.
+        The memory-mapped view is returned if the rows are in one chunk.
+        '''
+        entry = self.streams.get(name)
+        total = self.n_rows(name)
+        stop = total if stop is None else min(stop, total)
+        if entry is None or start >= stop:
+            dtype = STREAMS[name][0] if entry is None else entry['dtype']
+            n_cols = 0 if entry is None else entry['n_cols']
+            return np.empty((0, n_cols), dtype=dtype)
+
+        chunk_rows = entry['chunk_rows']
+        first = start // chunk_rows
+        last = (stop - 1) // chunk_rows
+        parts = []
+        for i in range(first, last+1):
+            chunk = entry['chunks'][i]
+            data = self._map(entry, chunk)
+            a = max(start - chunk[1], 0)
+            b = min(stop - chunk[1], chunk[2])
+            parts.append(data[a:b])
+
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def n_trials(self):
+        return len(self.markers)
+
+    def trial(self, i: int, n_samples: int, offset: int = 0):
+        '''
+        Read the i-th trial.
+
+        :param i: The trial index.
+        :param n_samples: The number of the EEG samples.
+        :param offset: The offset samples relative to the marker.
+
+        :return: The cue, the onset frame and the EEG, (n_samples, n_channels).
+        '''
+        cue, onset_frame, sample = self.markers[i]
+        start = int(sample) + offset
+        return int(cue), int(onset_frame), self.read('eeg', start, start + n_samples)
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+if __name__ == "__main__":
+    with SessionRecorder('session.ssrec') as rec:
+        rec.write_meta({'srate': 250, 'refresh_rate': 60})
+        for j in range(100):
+            rec.append_marker(j % 5, j * 60)
+            rec.append_eeg(np.random.randn(250, 8))
+            for k in range(60):
+                rec.append_frame(j + k / 60)
+
+    reader = SessionReader('session.ssrec')
+    print(reader.meta, reader.n_rows('eeg'), reader.n_rows('frames'))
+    cue, frame, eeg = reader.trial(42, 500)
+    print(cue, frame, eeg.shape)
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
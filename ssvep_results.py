@@ -0,0 +1,286 @@
+"""
+File: ssvep_results.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Indexed local results store of the sessions, the trials and the decoder outcomes.
+
+    The results are kept in the SQLite database,
+    one row per session and one row per trial,
+    they are inserted in bulk at the end of the session.
+    The queries return the NumPy arrays,
+    like the accuracy and the ITR by the subject, the frequency or the decision time.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import json
+import sqlite3
+import hashlib
+import numpy as np
+
+from datetime import datetime
+
+from util.logging import logger
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id INTEGER PRIMARY KEY,
+    subject TEXT NOT NULL,
+    session TEXT NOT NULL,
+    layout_hash TEXT NOT NULL,
+    n_targets INTEGER NOT NULL,
+    n_classes INTEGER NOT NULL,
+    trial_length REAL,
+    refresh_rate REAL,
+    created TEXT NOT NULL,
+    path TEXT,
+    UNIQUE (subject, session)
+);
+CREATE TABLE IF NOT EXISTS trials (
+    session_id INTEGER NOT NULL REFERENCES sessions (session_id),
+    trial INTEGER NOT NULL,
+    cue INTEGER NOT NULL,
+    freq REAL NOT NULL,
+    predicted INTEGER,
+    predicted_freq REAL,
+    decision_time REAL,
+    dropped_frames INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL,
+    PRIMARY KEY (session_id, trial)
+);
+CREATE INDEX IF NOT EXISTS sessions_subject ON sessions (subject);
+CREATE INDEX IF NOT EXISTS sessions_session ON sessions (session);
+CREATE INDEX IF NOT EXISTS sessions_layout ON sessions (layout_hash);
+CREATE INDEX IF NOT EXISTS trials_freq ON trials (freq);
+'''
+
+TRIAL_COLUMNS = ('trial', 'cue', 'freq', 'predicted', 'predicted_freq',
+                 'decision_time', 'dropped_frames', 'correct')
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+def layout_hash(layout):
+    '''
+    The short hash of the layout, like the SSVEPLayout.
+    '''
+    data = json.dumps(layout.to_dict(), sort_keys=True).encode('utf-8')
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def n_classes(layout):
+    '''
+    The number of the distinct frequencies of the layout,
+    the trials are judged by the frequency, so it is the number of the choices of the ITR.
+    '''
+    return len({v[0] for v in layout.blinks.values()})
+
+
+def itr(n_targets, accuracy, seconds):
+    '''
+    The Wolpaw information transfer rate (bits/min), the arguments are broadcast.
+
+    :param n_targets: The number of the targets.
+    :param accuracy: The accuracy (0, 1).
+    :param seconds: The time (seconds) per selection.
+    '''
+    n = np.asarray(n_targets, dtype=np.float64)
+    p = np.clip(np.asarray(accuracy, dtype=np.float64), 1e-12, 1 - 1e-12)
+    bits = np.log2(n) + p * np.log2(p) + (1 - p) * np.log2((1 - p) / (n - 1))
+    # It is zero at or below the chance level.
+    bits = np.where(p > 1 / n, bits, 0.0)
+    return bits * 60 / np.asarray(seconds, dtype=np.float64)
+
+
+class ResultsStore:
+    '''
+    The results database.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        logger.info(f'Opened results store: {path}')
+
+    def close(self):
+        self.conn.close()
+        return
+
+    def add_session(self, subject: str, session: str, layout, trials: dict,
+                    refresh_rate: float = None, path: str = None):
+        '''
+        Insert the session and its trials in one transaction.
+
+        :param subject: The subject.
+        :param session: The session name, it is unique for the subject.
+        :param layout: The layout, like the SSVEPLayout.
+        :param trials: The arrays of the trials, the keys are the TRIAL_COLUMNS except the correct,
+                       the missing predicted, predicted_freq and decision_time are NULL,
+                       the NULL decision_time is taken as the blink_length of the layout.
+        :param refresh_rate: The refresh rate (Hz).
+        :param path: The path of the session recording.
+
+        :return: The session_id.
+        '''
+        n = len(trials['cue'])
+        columns = []
+        for name in TRIAL_COLUMNS[:-1]:
+            if name == 'trial' and name not in trials:
+                values = range(n)
+            elif name == 'dropped_frames' and name not in trials:
+                values = [0] * n
+            else:
+                values = trials.get(name, [None] * n)
+            columns.append([_to_sql(v) for v in values])
+
+        freq = columns[TRIAL_COLUMNS.index('freq')]
+        predicted_freq = columns[TRIAL_COLUMNS.index('predicted_freq')]
+        correct = [int(p is not None and p == f)
+                   for f, p in zip(freq, predicted_freq)]
+
+        with self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO sessions (subject, session, layout_hash, n_targets, n_classes, trial_length, '
+                'refresh_rate, created, path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (subject, session, layout_hash(layout), len(layout.blinks), n_classes(layout),
+                 getattr(layout, 'blink_length', None), refresh_rate, datetime.now().isoformat(), path))
+            session_id = cursor.lastrowid
+            self.conn.executemany(
+                f'INSERT INTO trials (session_id, {", ".join(TRIAL_COLUMNS)}) '
+                f'VALUES ({", ".join("?" * (len(TRIAL_COLUMNS) + 1))})',
+                zip([session_id] * n, *columns, correct))
+
+        logger.info(f'Stored {n} trials of {subject}/{session}')
+        return session_id
+
+    def _where(self, subject=None, session=None, layout_hash=None, freq=None):
+        clauses, params = [], []
+        for column, value in (('s.subject', subject), ('s.session', session),
+                              ('s.layout_hash', layout_hash), ('t.freq', freq)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+        return where, params
+
+    def _query(self, sql: str, params, names):
+        rows = self.conn.execute(sql, params).fetchall()
+        if not rows:
+            return {name: np.array([]) for name in names}
+        return {name: np.array(col) for name, col in zip(names, zip(*rows))}
+
+    def trials(self, **filters):
+        '''
+        Query the trials, filtered by the subject, the session, the layout_hash or the freq.
+
+        :return: The arrays of the subject, the session and the TRIAL_COLUMNS, the NULL values are nan.
+        '''
+        where, params = self._where(**filters)
+        names = ('subject', 'session') + TRIAL_COLUMNS
+        sql = (f'SELECT s.subject, s.session, {", ".join("t." + c for c in TRIAL_COLUMNS)} '
+               f'FROM trials t JOIN sessions s USING (session_id){where} '
+               'ORDER BY s.session_id, t.trial')
+        result = self._query(sql, params, names)
+        for name in ('predicted', 'predicted_freq', 'decision_time'):
+            result[name] = _to_float(result[name])
+        return result
+
+    def accuracy_by(self, key: str, bin_width: float = 0.25, gap: float = 0.0, **filters):
+        '''
+        The accuracy and the ITR grouped by the key.
+
+        :param key: The 'subject', 'session', 'layout_hash', 'freq' or 'decision_time'.
+        :param bin_width: The bin width (seconds) of the decision_time.
+        :param gap: The extra time (seconds) per selection for the ITR, like the cue length.
+
+        :return: The arrays of the key, n, accuracy, mean decision_time, mean dropped_frames and itr,
+                 the itr counts the distinct frequencies as the choices, since the trials are judged by the frequency.
+        '''
+        # Every trial takes the time, the ones without the decision_time take the whole blink stage.
+        decision_time = 'COALESCE(t.decision_time, s.trial_length)'
+        groups = {
+            'subject': 's.subject',
+            'session': 's.session',
+            'layout_hash': 's.layout_hash',
+            'freq': 't.freq',
+            'decision_time': f'CAST({decision_time} / {float(bin_width)} AS INTEGER) * {float(bin_width)}',
+        }
+        if key not in groups:
+            raise ValueError(f'Unknown key: {key}')
+
+        where, params = self._where(**filters)
+        names = (key, 'n', 'accuracy', 'decision_time', 'dropped_frames', 'n_classes')
+        sql = (f'SELECT {groups[key]} AS k, COUNT(*), AVG(t.correct), AVG({decision_time}), '
+               f'AVG(t.dropped_frames), MAX(s.n_classes) '
+               f'FROM trials t JOIN sessions s USING (session_id){where} '
+               'GROUP BY k ORDER BY k')
+        result = self._query(sql, params, names)
+        result['decision_time'] = _to_float(result['decision_time'])
+        result['itr'] = itr(result['n_classes'], result['accuracy'],
+                            result['decision_time'] + gap)
+        return result
+
+
+def _to_float(values):
+    '''
+    Convert the values into the float array, the NULL values are nan.
+    '''
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _to_sql(value):
+    '''
+    Convert the numpy scalars and nan into the sqlite values.
+    '''
+    if value is None:
+        return None
+    if isinstance(value, (np.integer, np.bool_)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    return value
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+if __name__ == "__main__":
+    from ssvep_design import SSVEPLayout
+
+    store = ResultsStore(':memory:')
+    rng = np.random.default_rng(0)
+    for subject in ['s1', 's2']:
+        cues = np.arange(50) % 25 + 1
+        freq = np.array([SSVEPLayout.blinks[c][0] for c in cues])
+        hit = rng.uniform(size=50) < 0.8
+        store.add_session(subject, 'session-1', SSVEPLayout, {
+            'cue': cues,
+            'freq': freq,
+            'predicted': np.where(hit, cues, 1),
+            'predicted_freq': np.where(hit, freq, 30.0),
+            'decision_time': rng.uniform(0.5, 2.0, 50),
+        })
+
+    for key in ['subject', 'freq', 'decision_time']:
+        print(store.accuracy_by(key, gap=SSVEPLayout.cue_length))
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
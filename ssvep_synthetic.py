@@ -0,0 +1,348 @@
+"""
+File: ssvep_synthetic.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Synthetic SSVEP EEG stream for the load and latency testing.
+
+    The SSVEP responses follow the trial schedule of the layout,
+    with the harmonics, the latency, and the subject-specific amplitude and phase.
+    The 1/f background is mixed from the precomputed pink-noise sources,
+    and the eye blinks and the line noise are added as the artifacts.
+    The chunks are generated in the vectorized form,
+    and streamed in real time or as fast as possible,
+    into the shared-memory ring or the local socket.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import json
+import time
+import socket
+import numpy as np
+
+from multiprocessing import shared_memory
+
+from ssvep_design import compile_schedule
+from util.logging import logger
+
+# The length (samples) of the pink-noise table, it is looped.
+PINK_TABLE_LENGTH = 1 << 17
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+def pink_noise(n_sources: int, n_samples: int, rng: np.random.Generator):
+    '''
+    Make the 1/f noise by shaping the white noise in the frequency domain.
+
+    :return: The unit-variance noise, (n_samples, n_sources).
+    '''
+    spec = np.fft.rfft(rng.standard_normal((n_samples, n_sources)), axis=0)
+    f = np.arange(spec.shape[0])
+    f[0] = 1
+    spec /= np.sqrt(f)[:, None]
+    x = np.fft.irfft(spec, n=n_samples, axis=0)
+    return (x / x.std(axis=0)).astype(np.float32)
+
+
+class SyntheticSubject:
+    '''
+    The subject-specific parameters.
+
+    - amplitude: The SSVEP amplitude (uV), (n_channels, n_harmonics).
+    - phase: The SSVEP phase (rad), (n_channels, n_harmonics).
+    - latency: The visual latency (seconds).
+    '''
+
+    def __init__(self, n_channels: int, n_harmonics: int = 3, latency: float = 0.14,
+                 amplitude: float = 2.0, seed: int = None):
+        rng = np.random.default_rng(seed)
+        # The occipital channels (the last ones) respond stronger,
+        # and the harmonics decay.
+        spatial = np.linspace(0.2, 1.0, n_channels) * rng.uniform(0.5, 1.0, n_channels)
+        decay = 0.6 ** np.arange(n_harmonics)
+        self.amplitude = amplitude * spatial[:, None] * decay
+        self.phase = rng.uniform(0, 2 * np.pi, (n_channels, n_harmonics))
+        self.latency = latency
+        self.seed = seed
+
+
+class SyntheticEEG:
+    '''
+    The synthetic EEG generator, the chunks are generated one after another.
+    '''
+
+    def __init__(self, layout, srate: float = 2000, n_channels: int = 256, n_trials: int = 100,
+                 subject: SyntheticSubject = None, n_sources: int = 16, noise: float = 10.0,
+                 sensor_noise: float = 1.0, line_noise: float = 0.5, line_freq: float = 50.0,
+                 blink_rate: float = 0.2, blink_amplitude: float = 100.0, seed: int = None):
+        '''
+        :param layout: The layout, like the SSVEPLayout.
+        :param srate: The sampling rate (Hz).
+        :param n_channels: The number of the channels.
+        :param n_trials: The number of the trials in the schedule.
+        :param subject: The SyntheticSubject.
+        :param n_sources: The number of the 1/f background sources.
+        :param noise: The amplitude (uV) of the 1/f background.
+        :param sensor_noise: The amplitude (uV) of the white sensor noise.
+        :param line_noise: The amplitude (uV) of the line noise.
+        :param line_freq: The line frequency (Hz).
+        :param blink_rate: The eye blink rate (Hz).
+        :param blink_amplitude: The eye blink amplitude (uV) on the frontal channel.
+        '''
+        self.rng = np.random.default_rng(seed)
+        self.srate = srate
+        self.n_channels = n_channels
+        self.subject = SyntheticSubject(n_channels, seed=seed) if subject is None else subject
+
+        schedule = compile_schedule(layout, n_trials)
+        self.onset = schedule['onset']
+        self.offset = schedule['offset']
+        self.cue_length = layout.cue_length
+        self.trial_freqs = np.array([layout.blinks[c][0] for c in schedule['cue']])
+        self.duration = self.offset[-1]
+
+        # The SSVEP mixing, sin(h theta) @ a_sin + cos(h theta) @ a_cos.
+        amp, phase = self.subject.amplitude, self.subject.phase
+        self.harmonics = np.arange(1, amp.shape[1] + 1)
+        self.a_sin = (amp * np.cos(phase)).T.astype(np.float32)
+        self.a_cos = (amp * np.sin(phase)).T.astype(np.float32)
+
+        # The background is the pink-noise sources mixed into the channels.
+        self.pink = pink_noise(n_sources, PINK_TABLE_LENGTH, self.rng)
+        self.mixing = (self.rng.standard_normal((n_sources, n_channels)) *
+                       noise / np.sqrt(n_sources)).astype(np.float32)
+        self.sensor_noise = sensor_noise
+
+        self.line = line_noise * self.rng.uniform(0.5, 1.0, n_channels).astype(np.float32)
+        self.line_freq = line_freq
+
+        # The eye blinks are strong on the frontal channels (the first ones).
+        self.blink_rate = blink_rate
+        self.blink_weights = (blink_amplitude *
+                              np.exp(-np.arange(n_channels) / (n_channels / 8))).astype(np.float32)
+        self.blink_times = np.empty(0)
+
+        self.sample = 0
+        logger.info(
+            f'Synthetic EEG: {n_channels} channels at {srate} Hz, {n_trials} trials ({self.duration} s)')
+
+    def ssvep(self, t: np.ndarray):
+        '''
+        The SSVEP responses at the times t, (n_samples, n_channels).
+        '''
+        tt = t - self.subject.latency
+        k = np.searchsorted(self.offset, tt, side='right')
+        valid = (k < len(self.offset)) & (tt >= 0)
+        k = np.minimum(k, len(self.offset) - 1)
+        rel = tt - self.onset[k]
+        active = valid & (rel >= self.cue_length)
+
+        # The phase is locked to the trial onset, like the blink_luminance in the main_render.
+        theta = 2 * np.pi * (self.trial_freqs[k] * rel)[:, None] * self.harmonics
+        s = np.sin(theta).astype(np.float32) @ self.a_sin
+        s += np.cos(theta).astype(np.float32) @ self.a_cos
+        s *= active[:, None]
+        return s
+
+    def artifacts(self, t: np.ndarray):
+        '''
+        The eye blinks and the line noise at the times t, (n_samples, n_channels).
+        '''
+        out = np.sin(2 * np.pi * self.line_freq * t).astype(np.float32)[:, None] * self.line
+
+        # Draw the new blinks and drop the finished ones, the blink lasts about 0.4 seconds.
+        n_new = self.rng.poisson(self.blink_rate * (t[-1] - t[0] + 1 / self.srate))
+        if n_new:
+            new = self.rng.uniform(t[0], t[-1], n_new)
+            self.blink_times = np.concatenate([self.blink_times, new])
+        self.blink_times = self.blink_times[self.blink_times > t[0] - 0.4]
+
+        if len(self.blink_times):
+            d = (t[:, None] - self.blink_times) / 0.08
+            bump = np.exp(-0.5 * d * d).sum(axis=1).astype(np.float32)
+            out += bump[:, None] * self.blink_weights
+        return out
+
+    def next_chunk(self, n_samples: int):
+        '''
+        Generate the next chunk.
+
+        :return: The chunk (n_samples, n_channels) in float32 and the time of its first sample.
+        '''
+        i = self.sample + np.arange(n_samples)
+        t = i / self.srate
+
+        idx = i % PINK_TABLE_LENGTH
+        chunk = self.pink[idx] @ self.mixing
+        chunk += self.ssvep(t)
+        chunk += self.artifacts(t)
+        if self.sensor_noise:
+            chunk += self.rng.standard_normal(chunk.shape, dtype=np.float32) * self.sensor_noise
+
+        t0 = self.sample / self.srate
+        self.sample += n_samples
+        return chunk, t0
+
+
+class SharedMemoryRing:
+    '''
+    The ring buffer of the samples in the shared memory.
+
+    The header is (write count, n_channels, capacity, writing count) in int64,
+    like the seqlock, the writing count is updated before the samples are written,
+    and the write count is updated after them.
+    The reader copies the samples until the write count,
+    and checks the writing count after the copy,
+    the samples which may be overwritten during the copy are trimmed.
+    The reader lapped by the writer loses the oldest samples, and the number is reported.
+    '''
+
+    def __init__(self, name: str = None, n_channels: int = None, capacity: int = None):
+        '''
+        Create the ring with the n_channels and the capacity, or attach to the ring by the name.
+        '''
+        if n_channels is None:
+            self.shm = shared_memory.SharedMemory(name=name)
+            header = np.ndarray(4, dtype=np.int64, buffer=self.shm.buf)
+            n_channels, capacity = int(header[1]), int(header[2])
+            self.owner = False
+        else:
+            size = 4 * 8 + capacity * n_channels * 4
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.owner = True
+
+        self.header = np.ndarray(4, dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((capacity, n_channels), dtype=np.float32,
+                               buffer=self.shm.buf, offset=4 * 8)
+        if self.owner:
+            self.header[:] = (0, n_channels, capacity, 0)
+        self.name = self.shm.name
+        self.capacity = capacity
+
+    def write(self, chunk: np.ndarray):
+        '''
+        Write the samples, only the last capacity rows are kept if the chunk is longer.
+        '''
+        count = int(self.header[0])
+        total = len(chunk)
+        chunk = chunk[-self.capacity:]
+        n = len(chunk)
+        i = (count + total - n) % self.capacity
+        first = min(n, self.capacity - i)
+        self.header[3] = count + total
+        self.data[i:i+first] = chunk[:first]
+        self.data[:n-first] = chunk[first:]
+        self.header[0] = count + total
+        return
+
+    def read(self, since: int):
+        '''
+        Read the samples written after the since count.
+
+        :return: The samples, the new count,
+                 and the number of the samples overwritten before they are read.
+        '''
+        count = int(self.header[0])
+        dropped = max(0, count - self.capacity - since)
+        since += dropped
+        idx = np.arange(since, count) % self.capacity
+        data = self.data[idx]
+
+        # The slots of the samples before writing - capacity may be overwritten during the copy.
+        torn = min(len(data), max(0, int(self.header[3]) - self.capacity - since))
+        return data[torn:], count, dropped + torn
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        return
+
+
+class SocketSink:
+    '''
+    Send the chunks to the local TCP socket.
+
+    The json header line of (srate, n_channels, dtype) is sent first,
+    followed by the raw float32 samples.
+    '''
+
+    def __init__(self, host: str, port: int, srate: float, n_channels: int):
+        self.sock = socket.create_connection((host, port))
+        header = {'srate': srate, 'n_channels': n_channels, 'dtype': '<f4'}
+        self.sock.sendall((json.dumps(header) + '\n').encode('utf-8'))
+
+    def write(self, chunk: np.ndarray):
+        self.sock.sendall(np.ascontiguousarray(chunk, dtype='<f4').data)
+        return
+
+    def close(self):
+        self.sock.close()
+        return
+
+
+def stream(generator: SyntheticEEG, sink, chunk_length: float = 0.02, realtime: bool = True,
+           duration: float = None):
+    '''
+    Stream the chunks into the sink.
+
+    :param chunk_length: The length (seconds) of the chunks.
+    :param realtime: Whether to pace the chunks by the wall clock, or as fast as possible.
+    :param duration: The duration (seconds), default is the schedule duration.
+    '''
+    n = max(1, int(chunk_length * generator.srate))
+    duration = generator.duration if duration is None else duration
+    total = int(duration * generator.srate)
+
+    tic = time.perf_counter()
+    busy = 0.0
+    while generator.sample < total:
+        t = time.perf_counter()
+        chunk, t0 = generator.next_chunk(min(n, total - generator.sample))
+        sink.write(chunk)
+        busy += time.perf_counter() - t
+
+        if realtime:
+            wait = tic + generator.sample / generator.srate - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+    elapsed = time.perf_counter() - tic
+    logger.info(
+        f'Streamed {duration} s in {elapsed:.2f} s, busy {busy:.2f} s ({busy / duration:.1%} of one core in real time)')
+    return
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+if __name__ == "__main__":
+    from ssvep_design import SSVEPLayout
+
+    generator = SyntheticEEG(SSVEPLayout, srate=2000, n_channels=256, n_trials=10, seed=0)
+    ring = SharedMemoryRing(n_channels=256, capacity=2000 * 10)
+    try:
+        stream(generator, ring, realtime=False)
+        data, count, dropped = ring.read(0)
+        print(data.shape, count, dropped)
+    finally:
+        ring.close()
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
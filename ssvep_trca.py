@@ -0,0 +1,526 @@
+"""
+File: ssvep_trca.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    TRCA and ensemble-TRCA training pipeline.
+
+    The epochs are in (n_targets, n_blocks, n_channels, n_samples) shape.
+    The per-block covariance terms are computed once and cached,
+    the leave-one-block-out folds are derived from the cache by subtraction,
+    and the folds or the subjects run across the process pool.
+    The trained model is saved into the compact binary file,
+    with the projected templates, so the loading memory-maps it without the computing.
+    The TRCADecoder loads the model at the startup,
+    and it decodes online with the interface of the DynamicStoppingDecoder.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import os
+import json
+import struct
+import numpy as np
+
+from threading import Lock
+from concurrent.futures import ProcessPoolExecutor
+
+from ssvep_decoder import Decision, margin_confidence
+from util.binary import aligned
+from util.logging import logger
+
+MODEL_MAGIC = b'SSVEPTRC'
+MODEL_VERSION = 1
+MODEL_DTYPE = '<f4'
+MODEL_ALIGN = 64
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+class CovarianceCache:
+    '''
+    The covariance terms of the TRCA, they are reused by all the folds.
+
+    - sums: The sum of the blocks, (n_targets, n_channels, n_samples).
+    - blocks: The centered epochs, (n_targets, n_blocks, n_channels, n_samples).
+    - block_cov: The X @ X.T of every block, (n_targets, n_blocks, n_channels, n_channels).
+    - cov: The sum of the block_cov, (n_targets, n_channels, n_channels).
+    '''
+
+    def __init__(self, epochs: np.ndarray):
+        blocks = np.asarray(epochs, dtype=np.float64)
+        blocks = blocks - blocks.mean(axis=-1, keepdims=True)
+        self.blocks = blocks
+        self.sums = blocks.sum(axis=1)
+        self.block_cov = np.einsum('kbct,kbdt->kbcd', blocks, blocks)
+        self.cov = self.block_cov.sum(axis=1)
+        self.n_blocks = blocks.shape[1]
+
+    def terms(self, exclude: int = None):
+        '''
+        Get the TRCA terms of the blocks.
+
+        :param exclude: The block to leave out.
+
+        :return: The S, Q matrices and the templates.
+        '''
+        if exclude is None:
+            sums = self.sums
+            q = self.cov
+            n = self.n_blocks
+        else:
+            sums = self.sums - self.blocks[:, exclude]
+            q = self.cov - self.block_cov[:, exclude]
+            n = self.n_blocks - 1
+
+        s = np.einsum('kct,kdt->kcd', sums, sums) - q
+        return s, q, sums / n
+
+
+def solve_trca(s: np.ndarray, q: np.ndarray, reg: float = 1e-6):
+    '''
+    Solve the generalized eigen problem S w = lambda Q w for every target.
+
+    :param s: The inter-block covariance, (n_targets, n_channels, n_channels).
+    :param q: The overall covariance, (n_targets, n_channels, n_channels).
+
+    :return: The spatial filters, (n_targets, n_channels).
+    '''
+    c = q.shape[-1]
+    trace = np.trace(q, axis1=-2, axis2=-1)[:, None, None]
+    lq = np.linalg.cholesky(q + np.eye(c) * trace * reg / c)
+    a = np.linalg.solve(lq, s)
+    m = np.linalg.solve(lq, a.swapaxes(-1, -2))
+    m = (m + m.swapaxes(-1, -2)) / 2
+    _, v = np.linalg.eigh(m)
+    w = np.linalg.solve(lq.swapaxes(-1, -2), v[..., -1:])[..., 0]
+    return w / np.linalg.norm(w, axis=-1, keepdims=True)
+
+
+class TRCAModel:
+    '''
+    The trained TRCA model.
+
+    :param filters: The spatial filters, (n_targets, n_channels).
+    :param templates: The templates, (n_targets, n_channels, n_samples).
+    :param freqs: The frequencies of the targets.
+    :param srate: The sampling rate (Hz).
+    :param ensemble: Whether to use the ensemble-TRCA.
+    :param projected: The projected templates, they are computed if not provided.
+    :param targets: The target ids (like the cues) of the templates, default is the indices.
+    '''
+
+    def __init__(self, filters, templates, freqs, srate: float, ensemble: bool = True, projected=None,
+                 targets=None):
+        self.filters = filters
+        self.templates = templates
+        self.freqs = list(freqs)
+        self.targets = list(range(len(self.freqs))) if targets is None else [int(t) for t in targets]
+        self.srate = srate
+        self.ensemble = ensemble
+
+        # Project the templates once.
+        if projected is None:
+            projected = project_templates(filters, templates, ensemble)
+        self.projected = projected
+
+    def correlations(self, trials: np.ndarray):
+        '''
+        Compute the correlations of the trials with every template.
+
+        The trials shorter than the templates use the same length of the templates.
+
+        :param trials: The trials, (n_trials, n_channels, n_samples).
+
+        :return: The correlations, (n_trials, n_targets).
+        '''
+        return correlate(self.filters, self.projected, trials, self.ensemble)
+
+    def predict(self, trials: np.ndarray):
+        '''
+        Predict the target indices of the trials.
+        '''
+        return np.argmax(self.correlations(trials), axis=-1)
+
+    def save(self, path):
+        '''
+        Save the model into the binary file.
+
+        The file is the magic, the header length (uint32), the json header,
+        and the float32 arrays aligned to MODEL_ALIGN bytes.
+        '''
+        arrays = {'filters': self.filters, 'templates': self.templates,
+                  'projected': self.projected}
+        header = {
+            'version': MODEL_VERSION,
+            'srate': self.srate,
+            'freqs': [float(f) for f in self.freqs],
+            'targets': self.targets,
+            'ensemble': self.ensemble,
+            'dtype': MODEL_DTYPE,
+            'arrays': {},
+        }
+
+        # The offsets depend on the header length, so it is computed with the padded header size.
+        shapes = {k: list(v.shape) for k, v in arrays.items()}
+        header_size = MODEL_ALIGN * 16
+        offset = header_size
+        for k, shape in shapes.items():
+            header['arrays'][k] = {'shape': shape, 'offset': offset}
+            offset += aligned(int(np.prod(shape)) * 4, MODEL_ALIGN)
+
+        buf = json.dumps(header).encode('utf-8')
+        prefix = len(MODEL_MAGIC) + 4
+        if prefix + len(buf) > header_size:
+            raise ValueError(f'Header is too large: {len(buf)} bytes')
+
+        with open(path, 'wb') as f:
+            f.write(MODEL_MAGIC)
+            f.write(struct.pack('<I', len(buf)))
+            f.write(buf)
+            f.write(b'\0' * (header_size - prefix - len(buf)))
+            for k, v in arrays.items():
+                data = np.ascontiguousarray(v, dtype=MODEL_DTYPE).tobytes()
+                f.write(data)
+                f.write(b'\0' * (aligned(len(data), MODEL_ALIGN) - len(data)))
+
+        logger.info(f'Saved TRCA model: {path}')
+        return
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Load the model from the binary file, the arrays are memory-mapped.
+        The projected templates are computed if the file has none.
+        '''
+        with open(path, 'rb') as f:
+            magic = f.read(len(MODEL_MAGIC))
+            if magic != MODEL_MAGIC:
+                raise ValueError(f'Not a TRCA model file: {path}')
+            size, = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(size).decode('utf-8'))
+
+        if header['version'] != MODEL_VERSION:
+            raise ValueError(f'Unsupported model version: {header["version"]}')
+
+        arrays = {
+            k: np.memmap(path, dtype=header['dtype'], mode='r',
+                         offset=v['offset'], shape=tuple(v['shape']))
+            for k, v in header['arrays'].items()
+        }
+        logger.info(f'Loaded TRCA model: {path}')
+        return cls(arrays['filters'], arrays['templates'],
+                   header['freqs'], header['srate'], header['ensemble'],
+                   projected=arrays.get('projected'), targets=header.get('targets'))
+
+
+def project_templates(filters: np.ndarray, templates: np.ndarray, ensemble: bool = True):
+    '''
+    Project the templates with the spatial filters.
+
+    :return: The projected templates, (n_targets, n_targets, n_samples) for the ensemble,
+             or (n_targets, n_samples).
+    '''
+    if ensemble:
+        return np.einsum('jc,kct->kjt', filters, templates)
+    return np.einsum('kc,kct->kt', filters, templates)
+
+
+def correlate(filters: np.ndarray, projected: np.ndarray, trials: np.ndarray, ensemble: bool = True):
+    '''
+    Compute the correlations of the trials with the projected templates.
+
+    :param trials: The trials, (n_trials, n_channels, n_samples).
+
+    :return: The correlations, (n_trials, n_targets).
+    '''
+    trials = np.asarray(trials, dtype=np.float64)
+    n = trials.shape[-1]
+    pt = np.asarray(projected[..., :n], dtype=np.float64)
+
+    if ensemble:
+        px = np.einsum('jc,nct->njt', filters, trials)
+        px = _normalize(px, axis=(-2, -1))
+        pt = _normalize(pt, axis=(-2, -1))
+        return np.einsum('njt,kjt->nk', px, pt)
+
+    px = np.einsum('kc,nct->nkt', filters, trials)
+    px = _normalize(px, axis=-1)
+    pt = _normalize(pt, axis=-1)
+    return np.einsum('nkt,kt->nk', px, pt)
+
+
+def _normalize(x: np.ndarray, axis):
+    x = x - x.mean(axis=axis, keepdims=True)
+    norm = np.sqrt((x * x).sum(axis=axis, keepdims=True))
+    return x / np.maximum(norm, 1e-12)
+
+
+def train(epochs: np.ndarray, freqs, srate: float, ensemble: bool = True, cache: CovarianceCache = None, exclude: int = None,
+          targets=None):
+    '''
+    Train the TRCA model.
+
+    :param epochs: The epochs, (n_targets, n_blocks, n_channels, n_samples).
+    :param freqs: The frequencies of the targets.
+    :param srate: The sampling rate (Hz).
+    :param ensemble: Whether to use the ensemble-TRCA.
+    :param cache: The CovarianceCache of the epochs, it is computed if not provided.
+    :param exclude: The block to leave out.
+    :param targets: The target ids of the epochs, like the ones from the Epochs.to_blocks().
+
+    :return: The TRCAModel.
+    '''
+    if cache is None:
+        cache = CovarianceCache(epochs)
+    filters, templates = fit(cache, exclude)
+    return TRCAModel(filters, templates, freqs, srate, ensemble, targets=targets)
+
+
+class TRCADecoder:
+    '''
+    The online TRCA decoder, it is the drop-in of the DynamicStoppingDecoder.
+
+    The samples are fed by update() from the acquisition thread into the buffer of the template length,
+    and the render loop calls poll_decision() at every frame.
+    The reset() is called at the onset of the blink stage.
+    The correlations with the templates are evaluated every eval_interval,
+    the decision is made when the confidence reaches the threshold,
+    or the buffer is full, or the finish() is called.
+    '''
+
+    def __init__(self, model: TRCAModel, min_length: float = 0.3, eval_interval: float = 0.05,
+                 threshold: float = 0.3, latency: float = 0.0):
+        '''
+        :param model: The TRCAModel, like the TRCAModel.load(path).
+        :param min_length: The min data length (seconds) before the first decision.
+        :param eval_interval: The interval (seconds) of the evaluation.
+        :param threshold: The confidence threshold.
+        :param latency: The visual latency (seconds), the samples within it are skipped,
+                        it is the latency of the training epochs.
+        '''
+        self.model = model
+        self.srate = model.srate
+        self.freqs = model.freqs
+        self.targets = [(t,) for t in model.targets]
+        self.n_channels = model.templates.shape[1]
+        self.max_samples = model.templates.shape[2]
+        self.min_samples = int(min_length * self.srate)
+        self.eval_samples = max(1, int(eval_interval * self.srate))
+        self.latency_samples = int(latency * self.srate)
+        self.threshold = threshold
+
+        # The samples of the trial, (n_samples, n_channels).
+        self.buffer = np.zeros((self.max_samples, self.n_channels))
+
+        self.lock = Lock()
+        self.reset()
+        logger.info(
+            f'TRCA decoder initialized with {len(self.freqs)} targets, {self.n_channels} channels at {self.srate} Hz')
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        '''
+        Make the decoder with the model file, the model is memory-mapped.
+        '''
+        return cls(TRCAModel.load(path), **kwargs)
+
+    def reset(self):
+        '''
+        Clear the samples at the start of the trial.
+        '''
+        with self.lock:
+            self.n = 0
+            self.skip = self.latency_samples
+            self.next_eval = max(self.min_samples, self.eval_samples)
+            self.decision = None
+            self.decided = False
+        return
+
+    def update(self, chunk: np.ndarray):
+        '''
+        Append the samples.
+
+        :param chunk: The samples in (n_samples, n_channels) shape.
+        '''
+        with self.lock:
+            if self.decided:
+                return
+
+            chunk = np.asarray(chunk)
+            skip = min(self.skip, len(chunk))
+            self.skip -= skip
+            chunk = chunk[skip:]
+            n = min(len(chunk), self.max_samples - self.n)
+            self.buffer[self.n:self.n+n] = chunk[:n]
+            self.n += n
+
+            if self.n >= self.max_samples:
+                self._decide(force=True)
+            elif self.n >= self.next_eval:
+                # The chunk may span several evaluation points, they are evaluated once with the latest samples.
+                self.next_eval += ((self.n - self.next_eval) // self.eval_samples + 1) * self.eval_samples
+                self._decide(force=False)
+        return
+
+    def correlations(self):
+        '''
+        Compute the correlations of the current samples with the templates.
+
+        :return: The correlations in (n_targets, ) shape.
+        '''
+        return self.model.correlations(self.buffer[None, :self.n].transpose(0, 2, 1))[0]
+
+    def _decide(self, force: bool):
+        rho = self.correlations()
+        i, confidence = margin_confidence(rho)
+
+        if not force and confidence < self.threshold:
+            return
+
+        self.decision = Decision(self.freqs[i], self.targets[i], rho,
+                                 confidence, self.n / self.srate)
+        self.decided = True
+        logger.debug(f'Decided: {self.decision}')
+        return
+
+    def finish(self):
+        '''
+        Force the decision with the samples so far, it is called when the blink stage times out.
+        '''
+        with self.lock:
+            if not self.decided and self.n > 1:
+                self._decide(force=True)
+        return
+
+    def poll_decision(self):
+        '''
+        Fetch the decision, it is only returned once.
+
+        :return: The Decision or None.
+        '''
+        with self.lock:
+            decision = self.decision
+            self.decision = None
+        return decision
+
+
+def fit(cache: CovarianceCache, exclude: int = None):
+    '''
+    Fit the spatial filters and the templates from the cache.
+
+    :param exclude: The block to leave out.
+
+    :return: The filters (n_targets, n_channels) and the templates (n_targets, n_channels, n_samples).
+    '''
+    s, q, templates = cache.terms(exclude)
+    return solve_trca(s, q), templates
+
+
+def fold_accuracy(cache: CovarianceCache, block: int, ensemble: bool = True):
+    '''
+    The accuracy of the fold leaving the block out.
+    '''
+    filters, templates = fit(cache, block)
+    projected = project_templates(filters, templates, ensemble)
+    rho = correlate(filters, projected, cache.blocks[:, block], ensemble)
+    predicted = np.argmax(rho, axis=-1)
+    return np.mean(predicted == np.arange(len(predicted)))
+
+
+# The cache of the worker process, it is sent once by the pool initializer.
+_worker_cache: CovarianceCache = None
+
+
+def _init_worker(cache: CovarianceCache):
+    global _worker_cache
+    _worker_cache = cache
+
+
+def _run_fold(block: int, ensemble: bool):
+    return fold_accuracy(_worker_cache, block, ensemble)
+
+
+def cross_validate(epochs: np.ndarray, ensemble: bool = True, n_workers: int = None):
+    '''
+    Leave-one-block-out cross-validation, the folds run across the process pool.
+
+    :param epochs: The epochs, (n_targets, n_blocks, n_channels, n_samples).
+    :param ensemble: Whether to use the ensemble-TRCA.
+    :param n_workers: The number of processes, 1 runs the folds in the current process.
+
+    :return: The accuracies of the folds.
+    '''
+    cache = CovarianceCache(epochs)
+    blocks = range(cache.n_blocks)
+
+    if n_workers == 1:
+        return np.array([fold_accuracy(cache, b, ensemble) for b in blocks])
+
+    # The cache is pickled once per worker, and the folds only send the block index.
+    n_workers = min(n_workers or os.cpu_count(), cache.n_blocks)
+    with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(cache,)) as pool:
+        futures = [pool.submit(_run_fold, b, ensemble) for b in blocks]
+        return np.array([f.result() for f in futures])
+
+
+def _run_subject(epochs: np.ndarray, ensemble: bool):
+    return cross_validate(epochs, ensemble, n_workers=1)
+
+
+def cross_validate_subjects(subjects: dict, ensemble: bool = True, n_workers: int = None):
+    '''
+    Cross-validate the subjects across the process pool,
+    the folds of every subject run in the same process.
+
+    :param subjects: The epochs of the subjects, {name: epochs}.
+
+    :return: The fold accuracies of the subjects, {name: accuracies}.
+    '''
+    with ProcessPoolExecutor(n_workers) as pool:
+        futures = {name: pool.submit(_run_subject, epochs, ensemble)
+                   for name, epochs in subjects.items()}
+        results = {name: f.result() for name, f in futures.items()}
+
+    for name, acc in results.items():
+        logger.info(f'Subject {name}: accuracy {acc.mean():.3f}')
+    return results
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+if __name__ == "__main__":
+    from ssvep_decoder import make_reference_signals
+    from ssvep_design import SSVEPLayout
+
+    srate = 250
+    freqs = sorted({e[0] for e in SSVEPLayout.blinks.values()})
+    ref = make_reference_signals(freqs, srate, srate, 1)[..., 0].T
+    mixing = np.random.randn(8)
+    epochs = (ref[:, None, None, :] * mixing[:, None] +
+              np.random.randn(len(freqs), 6, 8, srate) * 2)
+
+    acc = cross_validate(epochs, ensemble=True)
+    print(f'Accuracy: {acc.mean():.3f}, {acc}')
+
+    model = train(epochs, freqs, srate)
+    model.save('trca.model')
+    print(TRCAModel.load('trca.model').predict(epochs[:, 0]))
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
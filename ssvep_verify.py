@@ -0,0 +1,211 @@
+"""
+File: ssvep_verify.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Spectral verification of the stimulus across the refresh rates.
+
+    The blink luminance is sampled once per frame,
+    so the target frequencies above the half of the refresh rate are aliased.
+    The per-frame luminance traces of all the targets and all the refresh rates
+    are FFT-ed in one batch, and the report includes
+    the dominant frequency error, the aliasing and the inter-target spectral overlap.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import numpy as np
+
+from ssvep_design import blink_luminance
+from util.logging import logger
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+def luminance_traces(layout, refresh_rate: float, duration: float = None):
+    '''
+    Make the per-frame luminance traces of the blinks, like they are drawn by the main_render.
+
+    :param layout: The layout, like the SSVEPLayout.
+    :param refresh_rate: The refresh rate (Hz).
+    :param duration: The duration (seconds), default is the blink_length.
+
+    :return: The traces, (n_targets, n_frames).
+    '''
+    if duration is None:
+        duration = layout.blink_length
+    freqs = np.array([e[0] for e in layout.blinks.values()])
+    n_frames = int(round(duration * refresh_rate))
+    t = layout.cue_length + np.arange(n_frames) / refresh_rate
+    return blink_luminance(t[None, :], freqs[:, None])
+
+
+class VerificationReport:
+    '''
+    The verification report, the arrays are in (n_rates, n_targets) shape if not specified.
+
+    - freqs: The nominal frequencies, (n_targets, ).
+    - refresh_rates: The refresh rates, (n_rates, ).
+    - dominant: The dominant frequencies of the traces.
+    - error: The dominant - nominal frequencies.
+    - aliased: Whether the nominal frequency reaches the Nyquist frequency.
+    - overlap: The spectral cosine similarity of the targets, (n_rates, n_targets, n_targets).
+    - conflicts: The target pairs overlapping with each other, [(rate, i, j), ...].
+    - duplicates: The target pairs with the same nominal frequency, [(i, j), ...].
+    '''
+
+    def __init__(self, targets, freqs, refresh_rates, dominant, overlap, tolerance, max_overlap):
+        self.targets = targets
+        self.freqs = freqs
+        self.refresh_rates = refresh_rates
+        self.dominant = dominant
+        self.error = dominant - freqs
+        self.aliased = freqs[None, :] >= refresh_rates[:, None] / 2
+        self.overlap = overlap
+        self.tolerance = tolerance
+        self.max_overlap = max_overlap
+
+        same = freqs[:, None] == freqs[None, :]
+        upper = np.triu(np.ones_like(same), k=1)
+        self.duplicates = [(targets[i], targets[j])
+                           for i, j in zip(*np.nonzero(same & upper))]
+        self.conflicts = [(refresh_rates[r], targets[i], targets[j])
+                          for r, i, j in zip(*np.nonzero((overlap > max_overlap) & ~same & upper))]
+
+    def ok(self, refresh_rate: float = None):
+        '''
+        Whether the frequencies are fine at the refresh rate, or at all of them.
+        '''
+        rates = self.refresh_rates
+        select = np.ones(len(rates), dtype=bool) if refresh_rate is None else rates == refresh_rate
+        bad = self.aliased | (np.abs(self.error) > self.tolerance)
+        return not (bad[select].any() or any(c[0] in rates[select] for c in self.conflicts))
+
+    def problems(self, refresh_rate: float = None):
+        '''
+        Describe the problems as the lines.
+        '''
+        lines = []
+        for r, rate in enumerate(self.refresh_rates):
+            if refresh_rate is not None and rate != refresh_rate:
+                continue
+            for k, target in enumerate(self.targets):
+                f = self.freqs[k]
+                if self.aliased[r, k]:
+                    lines.append(
+                        f'{rate} Hz: target {target} ({f} Hz) is aliased to {self.dominant[r, k]:.2f} Hz')
+                elif abs(self.error[r, k]) > self.tolerance:
+                    lines.append(
+                        f'{rate} Hz: target {target} ({f} Hz) peaks at {self.dominant[r, k]:.2f} Hz')
+            for rr, i, j in self.conflicts:
+                if rr == rate:
+                    lines.append(f'{rate} Hz: targets {i} and {j} overlap')
+        return lines
+
+
+def _dominant_frequency(mag: np.ndarray, bin_hz: np.ndarray):
+    '''
+    The peak frequencies with the parabolic interpolation, the DC bin is skipped.
+
+    :param mag: The magnitude spectrum, (n_rates, n_targets, n_bins).
+    :param bin_hz: The frequency of one bin, (n_rates, ).
+    '''
+    k = np.argmax(mag[..., 1:], axis=-1) + 1
+    a = np.take_along_axis(mag, np.maximum(k-1, 0)[..., None], -1)[..., 0]
+    b = np.take_along_axis(mag, k[..., None], -1)[..., 0]
+    c = np.take_along_axis(mag, np.minimum(k+1, mag.shape[-1]-1)[..., None], -1)[..., 0]
+    denom = a - 2 * b + c
+    delta = np.where(denom != 0, 0.5 * (a - c) / np.where(denom != 0, denom, 1), 0)
+    return (k + delta) * bin_hz[:, None]
+
+
+def verify_traces(traces: dict, freqs, targets=None, tolerance: float = 0.2, max_overlap: float = 0.5, pad: int = 4):
+    '''
+    Verify the luminance traces.
+
+    The traces may be generated or sampled from the headless-rendered frames.
+
+    :param traces: The traces of the refresh rates, {rate: (n_targets, n_frames)}.
+    :param freqs: The nominal frequencies of the targets.
+    :param targets: The target ids, default is the indices.
+    :param tolerance: The max dominant frequency error (Hz).
+    :param max_overlap: The max spectral cosine similarity of the targets with different frequencies.
+    :param pad: The zero-padding factor of the FFT.
+
+    :return: The VerificationReport.
+    '''
+    freqs = np.asarray(freqs, dtype=np.float64)
+    if targets is None:
+        targets = list(range(len(freqs)))
+    rates = np.array(sorted(traces), dtype=np.float64)
+    lengths = [traces[r].shape[-1] for r in sorted(traces)]
+    n_fft = 1 << int(np.ceil(np.log2(max(lengths) * pad)))
+
+    # Hann-windowed and zero-padded traces of all the rates, one FFT for all.
+    batch = np.zeros((len(rates), len(freqs), n_fft))
+    for r, rate in enumerate(sorted(traces)):
+        x = np.asarray(traces[rate], dtype=np.float64)
+        x = x - x.mean(axis=-1, keepdims=True)
+        batch[r, :, :x.shape[-1]] = x * np.hanning(x.shape[-1])
+    mag = np.abs(np.fft.rfft(batch, axis=-1))
+
+    dominant = _dominant_frequency(mag, rates / n_fft)
+
+    spec = mag[..., 1:]
+    spec = spec / np.maximum(np.linalg.norm(spec, axis=-1, keepdims=True), 1e-12)
+    overlap = np.einsum('rkf,rjf->rkj', spec, spec)
+
+    return VerificationReport(targets, freqs, rates, dominant, overlap, tolerance, max_overlap)
+
+
+def verify_layout(layout, refresh_rates, duration: float = None, **kwargs):
+    '''
+    Verify the blinks of the layout at the refresh rates.
+
+    :param layout: The layout, like the SSVEPLayout.
+    :param refresh_rates: The refresh rates (Hz).
+    :param duration: The duration (seconds), default is the blink_length.
+
+    :return: The VerificationReport.
+    '''
+    targets = list(layout.blinks.keys())
+    freqs = [layout.blinks[i][0] for i in targets]
+    traces = {rate: luminance_traces(layout, rate, duration) for rate in refresh_rates}
+    report = verify_traces(traces, freqs, targets, **kwargs)
+
+    for line in report.problems():
+        logger.warning(line)
+    if report.duplicates:
+        logger.warning(
+            f'{len(report.duplicates)} target pairs share the same frequency')
+    return report
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+if __name__ == "__main__":
+    import sys
+    from ssvep_design import SSVEPLayout
+
+    rates = [float(e) for e in sys.argv[1:]] or [60, 120, 144, 240]
+    report = verify_layout(SSVEPLayout, rates)
+    for rate in rates:
+        print(f'{rate} Hz: {"OK" if report.ok(rate) else "REJECTED"}')
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
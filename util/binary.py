@@ -0,0 +1,41 @@
+"""
+File: binary.py
+Author: Chuncheng Zhang
+Date: 2026-10-19
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Helpers of the binary files, like the TRCA model and the session recording.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-19 ------------------------
+# Requirements and constants
+
+
+# %% ---- 2026-10-19 ------------------------
+# Function and class
+def aligned(n: int, align: int):
+    '''
+    Round the n bytes up to the multiple of the align.
+    '''
+    return (n + align - 1) // align * align
+
+
+# %% ---- 2026-10-19 ------------------------
+# Play ground
+
+
+# %% ---- 2026-10-19 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-19 ------------------------
+# Pending
@@ -0,0 +1,81 @@
+"""
+File: clock.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Pluggable clocks for the StopWatch.
+
+    - RealClock: The wall clock.
+    - FrameClock: The frame-locked clock, it advances one refresh interval per frame.
+    - VirtualClock: The clock is set by the caller, like the replay runner.
+
+    The tick() is called once per frame, it is no-op for the real and the virtual clocks.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import time
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+class RealClock:
+    def now(self):
+        return time.time()
+
+    def tick(self):
+        return
+
+
+class FrameClock:
+    def __init__(self, refresh_rate: float):
+        self.refresh_rate = refresh_rate
+        self.frame = 0
+
+    def now(self):
+        return self.frame / self.refresh_rate
+
+    def tick(self):
+        self.frame += 1
+        return
+
+
+class VirtualClock:
+    def __init__(self, t: float = 0.0):
+        self.t = t
+
+    def now(self):
+        return self.t
+
+    def set(self, t: float):
+        self.t = t
+        return
+
+    def advance(self, dt: float):
+        self.t += dt
+        return
+
+    def tick(self):
+        return
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
@@ -0,0 +1,92 @@
+"""
+File: egl_context.py
+Author: Chuncheng Zhang
+Date: 2026-10-19
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Headless OpenGL context by the EGL, for the offscreen rendering without the display,
+    like the allocation gate and the replay on the CI machine.
+
+    It is used when the PyOpenGL runs on the EGL, i.e. PYOPENGL_PLATFORM=egl,
+    the Mesa llvmpipe provides the context with EGL_PLATFORM=surfaceless.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-19 ------------------------
+# Requirements and constants
+import os
+import ctypes
+
+from .logging import logger
+
+
+# %% ---- 2026-10-19 ------------------------
+# Function and class
+def is_headless():
+    '''
+    Whether the PyOpenGL runs on the EGL, it is set before the OpenGL is imported.
+    '''
+    return os.environ.get('PYOPENGL_PLATFORM') == 'egl'
+
+
+class EGLContext:
+    '''
+    The OpenGL context on the pbuffer surface, it is current after the creation.
+    '''
+
+    def __init__(self, width: int, height: int):
+        from OpenGL import EGL
+
+        self.egl = EGL
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError('Failed initialize EGL')
+
+        attributes = (EGL.EGLint * 13)(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8,
+            EGL.EGL_ALPHA_SIZE, 8, EGL.EGL_NONE)
+        config = EGL.EGLConfig()
+        n = EGL.EGLint()
+        if not EGL.eglChooseConfig(self.display, attributes, ctypes.pointer(config), 1, ctypes.pointer(n)) or n.value == 0:
+            EGL.eglTerminate(self.display)
+            raise RuntimeError('Can not find the EGL config')
+
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+        size = (EGL.EGLint * 5)(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE)
+        self.surface = EGL.eglCreatePbufferSurface(self.display, config, size)
+        if not EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context):
+            self.close()
+            raise RuntimeError('Can not make the EGL context current')
+        logger.info(f'Using EGL context: {major.value}.{minor.value}, {width} x {height}')
+
+    def close(self):
+        EGL = self.egl
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroySurface(self.display, self.surface)
+        EGL.eglDestroyContext(self.display, self.context)
+        EGL.eglTerminate(self.display)
+        return
+
+
+# %% ---- 2026-10-19 ------------------------
+# Play ground
+
+
+# %% ---- 2026-10-19 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-19 ------------------------
+# Pending
@@ -31,6 +31,19 @@ from OpenGL.GL import *
 
 from .logging import logger
 from .fps_ruler import FPSRuler
+from .profiler import FrameProfiler
+from .clock import RealClock
+from .egl_context import EGLContext, is_headless
+
+# The interval (seconds) of updating the clock and FPS text of the HUD.
+HUD_INTERVAL = 0.5
+
+# The fraction of the stimulus frame period after its swap, that the extra displays can use.
+# The extra display is skipped in this frame if its render can not finish in time.
+EXTRA_DISPLAY_BUDGET = 0.5
+
+# The smoothing factor of the render cost of the extra displays.
+EXTRA_DISPLAY_COST_ALPHA = 0.1
 
 
 # %% ---- 2025-04-13 ------------------------
@@ -56,18 +69,60 @@ class TextAnchor(Enum):
     S = 8
 
 
+# The (x, y) offsets of the anchors in the (w, h) units.
+ANCHOR_OFFSETS = {
+    TextAnchor.CENTER: (0.5, 0.5),
+    TextAnchor.NW: (0.0, 1.0),
+    TextAnchor.NE: (1.0, 1.0),
+    TextAnchor.N: (0.5, 1.0),
+    TextAnchor.W: (0.0, 0.5),
+    TextAnchor.E: (1.0, 0.5),
+    TextAnchor.SW: (0.0, 0.0),
+    TextAnchor.SE: (1.0, 0.0),
+    TextAnchor.S: (0.5, 0.0),
+}
+
+# The gray colors of the 8-bit levels, the float colors are converted once and cached.
+GRAYS = tuple((i / 255, i / 255, i / 255, 1.0) for i in range(256))
+_COLORS = {}
+
+
+def as_color(color):
+    '''
+    Convert the float color c into (c, c, c, c), the tuple is cached.
+    '''
+    if not isinstance(color, float):
+        return color
+    rgba = _COLORS.get(color)
+    if rgba is None:
+        rgba = (color, color, color, color)
+        _COLORS[color] = rgba
+    return rgba
+
+
 class TextRenderer:
     def __init__(self, max_cache_size=1024):
         self.face = None
         self.characters = OrderedDict()  # 使用有序字典实现LRU缓存
         self.max_cache_size = max_cache_size  # 最大缓存字符数
+        self.boxes = {}  # {scale: {text: (w, h)}}
+        self.viewport = (0, 0)  # 视口尺寸, 由窗口设置
 
     def load_font(self, font_path, size):
         """初始化字体"""
+        # The cached glyphs and boxes belong to the previous font.
+        self.release()
         self.face = freetype.Face(font_path)
         self.face.set_char_size(size << 6)
         logger.info(f'Using font: {font_path} ({size})')
 
+    def release(self):
+        """释放字符纹理和缓存, 在 GL 上下文销毁前调用"""
+        if self.characters:
+            glDeleteTextures([c['texture'] for c in self.characters.values()])
+        self.characters.clear()
+        self.boxes.clear()
+
     def load_char(self, char):
         """动态加载单个字符（支持中文字符）"""
         # 如果字符已在缓存中，移到最前面表示最近使用
@@ -135,7 +190,19 @@ class TextRenderer:
         return True
 
     def bounding_box(self, text, scale=1.0):
-        """计算文本的边界框"""
+        """计算文本的边界框, 结果按 scale 和 text 缓存"""
+        boxes = self.boxes.get(scale)
+        if boxes is None:
+            boxes = {}
+            self.boxes[scale] = boxes
+        box = boxes.get(text)
+        if box is not None:
+            return box
+
+        # Prevent the changing texts from growing the cache.
+        if len(boxes) >= self.max_cache_size:
+            boxes.clear()
+
         width = 0
         height = 0
         for char in text:
@@ -146,7 +213,9 @@ class TextRenderer:
             width += ch['advance'] * scale
             height = max(height, ch['size'][1] * scale)
 
-        return width, height
+        box = (width, height)
+        boxes[text] = box
+        return box
 
     def render_text(self, text, x, y, scale=1.0, color=(1.0, 1.0, 1.0, 1.0)):
         '''
@@ -162,9 +231,7 @@ class TextRenderer:
         glColor4f(*color)
 
         # 获取视口尺寸用于坐标转换
-        viewport = glGetIntegerv(GL_VIEWPORT)
-        screen_width = viewport[2]
-        screen_height = viewport[3]
+        screen_width, screen_height = self.viewport
 
         # 设置正交投影
         glMatrixMode(GL_PROJECTION)
@@ -217,6 +284,29 @@ class TextRenderer:
         # glDisable(GL_BLEND)
 
 
+class Display:
+    '''
+    The window on one monitor.
+    '''
+
+    def __init__(self, window, name: str, width: int, height: int, refresh_rate: int, render: callable):
+        self.window = window
+        self.name = name
+        self.width = width
+        self.height = height
+        self.refresh_rate = refresh_rate
+        self.render = render
+        self.fps = FPSRuler()
+        self.next_due = 0.0
+        # The smoothed seconds of the context switch, render and swap, and the skipped frames.
+        self.cost = 0.0
+        self.skipped = 0
+        self.scope_name = f'extra_display:{name}'
+        # The framebuffer size, it is the initial GL_VIEWPORT,
+        # and it differs from the mode size on the scaled displays.
+        self.viewport = glfw.get_framebuffer_size(window)
+
+
 class GLFWWindow:
     # Monitor params (Read-only)
     width: int
@@ -225,14 +315,24 @@ class GLFWWindow:
 
     # Window
     window = None
+    displays: list = []
+    frame_count: int = 0
 
     # Options
     is_focused = True
     click_through = False
 
+    # HUD
+    hud_banner: str = None
+    hud_clock: str = ''
+    hud_tic: float = 0.0
+
     # Addons
     text_renderer = TextRenderer()
     fps = FPSRuler()
+    profiler = FrameProfiler()
+    # The clock of the HUD throttle, it is replaced by the VirtualClock in the offscreen rendering.
+    hud_timer = RealClock()
 
     def __init__(self):
         pass
@@ -263,87 +363,283 @@ class GLFWWindow:
 
         return
 
-    def render_loop(self, key_callback: callable, main_render: callable):
-        if not glfw.init():
-            raise RuntimeError('Failed initialize GLFW')
-
-        # 获取主显示器
-        primary_monitor = glfw.get_primary_monitor()
+    def create_display(self, monitor, render: callable, key_callback: callable, share=None):
+        '''
+        Create the full-screen window on the monitor.
 
+        :param share: The window to share the GL objects with, like the glyph textures.
+                      The window without share is the stimulus display with the vsync,
+                      the others are drawn without the vsync.
+        '''
         # 获取视频模式(包含分辨率信息)
-        vid_mode = glfw.get_video_mode(primary_monitor)
+        vid_mode = glfw.get_video_mode(monitor)
 
         # 提取分辨率
         width, height = vid_mode.size
         refresh_rate = vid_mode.refresh_rate
-        self.width = width
-        self.height = height
-        self.refresh_rate = refresh_rate
+        name = glfw.get_monitor_name(monitor)
         logger.info(
-            f'Using primary monitor: {width} x {height} ({refresh_rate} Hz)')
-
-        # 配置窗口
-        glfw.window_hint(glfw.TRANSPARENT_FRAMEBUFFER, glfw.TRUE)
-        glfw.window_hint(glfw.DECORATED, glfw.FALSE)  # 无边框
-        glfw.window_hint(glfw.SAMPLES, 4)  # 抗锯齿
-        glfw.window_hint(glfw.FLOATING, glfw.TRUE)  # 置顶窗口
-
-        # 设置点击穿透
-        # glfw.window_hint(glfw.MOUSE_PASSTHROUGH, glfw.TRUE)
+            f'Using monitor {name}: {width} x {height} ({refresh_rate} Hz)')
 
         # Leave out 1 pixel to prevent from crashing. But don't know why.
         window = glfw.create_window(
-            width-1, height-1, 'OpenGL Wnd.', None, None)
+            width-1, height-1, 'OpenGL Wnd.', None, share)
 
         if not window:
             glfw.terminate()
             raise RuntimeError(f'Can not create window: {glfw.get_error()}')
 
-        self.window = window
+        glfw.set_window_pos(window, *glfw.get_monitor_pos(monitor))
 
         # Make context and set callbacks.
         glfw.make_context_current(window)
-        glfw.set_window_focus_callback(window, self.on_focus_change)
+        glfw.swap_interval(1 if share is None else 0)
         glfw.set_key_callback(window, key_callback)
-        # self.update_window_attributes()
 
         # 设置混合模式以实现透明度
         glEnable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
+        return Display(window, name, width, height, refresh_rate, render)
+
+    def use_display(self, display):
+        '''
+        Make the display current, the draw_* methods draw on it.
+        '''
+        glfw.make_context_current(display.window)
+        self.width = display.width
+        self.height = display.height
+        self.text_renderer.viewport = display.viewport
+        return
+
+    def render_loop(self, key_callback: callable, main_render: callable, on_frame: callable = None, extra_displays: list = None):
+        '''
+        The render loop.
+
+        The main_render draws on the primary monitor with the vsync.
+        The extra displays, like the operator screen or the other panels,
+        share the GL objects with the primary one,
+        and they are drawn without the vsync at their own refresh rates,
+        so the swaps on the slower displays do not block the stimulus display.
+
+        :param on_frame: Called with (frame index, timestamp) after every frame is swapped.
+        :param extra_displays: The [(monitor index, render), ...] of the other monitors.
+        '''
+        if not glfw.init():
+            raise RuntimeError('Failed initialize GLFW')
+
+        # 配置窗口
+        glfw.window_hint(glfw.TRANSPARENT_FRAMEBUFFER, glfw.TRUE)
+        glfw.window_hint(glfw.DECORATED, glfw.FALSE)  # 无边框
+        glfw.window_hint(glfw.SAMPLES, 4)  # 抗锯齿
+        glfw.window_hint(glfw.FLOATING, glfw.TRUE)  # 置顶窗口
+
+        # 设置点击穿透
+        # glfw.window_hint(glfw.MOUSE_PASSTHROUGH, glfw.TRUE)
+
+        # 获取主显示器
+        primary_monitor = glfw.get_primary_monitor()
+        stimulus = self.create_display(
+            primary_monitor, main_render, key_callback)
+        stimulus.fps = self.fps
+
+        window = stimulus.window
+        self.window = window
+        self.refresh_rate = stimulus.refresh_rate
+        glfw.set_window_focus_callback(window, self.on_focus_change)
+        # self.update_window_attributes()
+
+        # The missing monitors are skipped, it falls back to the single display.
+        monitors = glfw.get_monitors()
+        others = []
+        for i, render in (extra_displays or []):
+            if not 0 <= i < len(monitors):
+                logger.warning(
+                    f'Monitor {i} is not connected ({len(monitors)} monitors), the display is skipped')
+                continue
+            others.append(self.create_display(
+                monitors[i], render, key_callback, share=window))
+        self.displays = [stimulus] + others
+        self.use_display(stimulus)
+
         # Main render
         fps = self.fps
-        while not glfw.window_should_close(window):
-            # 设置透明背景
-            glClearColor(0.0, 0.0, 0.0, 0.0)
-            glClear(GL_COLOR_BUFFER_BIT)
+        profiler = self.profiler
+        while not any(glfw.window_should_close(d.window) for d in self.displays):
+            with profiler.scope('frame'):
+                if others:
+                    self.use_display(stimulus)
+
+                with profiler.scope('clear'):
+                    # 设置透明背景
+                    glClearColor(0.0, 0.0, 0.0, 0.0)
+                    glClear(GL_COLOR_BUFFER_BIT)
+
+                with profiler.scope('hud'):
+                    self.draw_hud()
+
+                with profiler.scope('main_render'):
+                    main_render()
+
+                with profiler.scope('swap_buffers'):
+                    glfw.swap_buffers(window)
+                swapped = time.perf_counter()
+                if on_frame is not None:
+                    on_frame(self.frame_count, time.time())
+                self.frame_count += 1
+
+                if others:
+                    with profiler.scope('extra_displays'):
+                        self.render_extra_displays(
+                            others, swapped + EXTRA_DISPLAY_BUDGET / stimulus.refresh_rate)
+
+                with profiler.scope('poll_events'):
+                    try:
+                        glfw.poll_events()
+                    except Exception as e:
+                        print(e)
+                        raise e
+                fps.update()
+            profiler.next_frame()
+
+        # The glyph textures belong to the shared context, they are released before it is destroyed.
+        self.use_display(stimulus)
+        self.text_renderer.release()
+        glfw.terminate()
+        return
 
-            scale = 0.5
-            color = (1.0, 1.0, 1.0, 1.0)
+    def render_extra_displays(self, displays: list, deadline: float):
+        '''
+        Draw the extra displays which are due, they are paced by their own refresh rates.
 
-            text = f"GLFW ({glfw.__version__}) is Rendering at {width} x {height} ({refresh_rate} Hz)"
-            self.draw_text(text, 0, 1.0, scale, TextAnchor.NW, color)
+        They are drawn in the stimulus loop, so they are bounded by the deadline.
+        The display is skipped if its smoothed cost does not fit before the deadline,
+        it is still due and drawn in the next stimulus frame.
 
-            text = '窗口获得焦点' if self.is_focused else '窗口失去焦点'
-            self.draw_text(text, 0.5, 1.0, scale, TextAnchor.N, color)
+        :param deadline: The time.perf_counter() the extra displays must finish before.
+        '''
+        profiler = self.profiler
+        for d in displays:
+            now = time.perf_counter()
+            if now < d.next_due:
+                continue
+            if now + d.cost > deadline:
+                # The cost decays while skipping, so a single slow frame does not starve the display.
+                d.skipped += 1
+                d.cost *= 1.0 - EXTRA_DISPLAY_COST_ALPHA
+                continue
+            d.next_due += 1.0 / d.refresh_rate
+            if d.next_due < now:
+                d.next_due = now + 1.0 / d.refresh_rate
+
+            with profiler.scope(d.scope_name):
+                self.use_display(d)
+                glClearColor(0.0, 0.0, 0.0, 0.0)
+                glClear(GL_COLOR_BUFFER_BIT)
+                d.render()
+                glfw.swap_buffers(d.window)
+            d.fps.update()
+            cost = time.perf_counter() - now
+            d.cost += EXTRA_DISPLAY_COST_ALPHA * (cost - d.cost)
+        return
 
-            text = ' | '.join([
-                datetime.now().isoformat(),
-                f'FPS: {fps.get_fps():.2f}'
+    def draw_hud(self):
+        '''
+        Draw the HUD, the texts are rebuilt only when they change,
+        and the clock and FPS text is updated every HUD_INTERVAL seconds.
+        '''
+        if self.hud_banner is None:
+            self.hud_banner = f"GLFW ({glfw.__version__}) is Rendering at {self.width} x {self.height} ({self.refresh_rate} Hz)"
+
+        tic = self.hud_timer.now()
+        if tic - self.hud_tic > HUD_INTERVAL:
+            self.hud_tic = tic
+            self.hud_clock = ' | '.join([
+                datetime.now().isoformat(timespec='milliseconds'),
+                f'FPS: {self.fps.get_fps():.2f}'
             ])
-            self.draw_text(text, 1.0, 1.0, scale, TextAnchor.NE, color)
 
-            main_render()
+        scale = 0.5
+        color = 1.0
 
-            glfw.swap_buffers(window)
-            try:
-                glfw.poll_events()
-            except Exception as e:
-                print(e)
-                raise e
-            fps.update()
+        self.draw_text(self.hud_banner, 0, 1.0, scale, TextAnchor.NW, color)
 
-        glfw.terminate()
+        text = '窗口获得焦点' if self.is_focused else '窗口失去焦点'
+        self.draw_text(text, 0.5, 1.0, scale, TextAnchor.N, color)
+
+        self.draw_text(self.hud_clock, 1.0, 1.0, scale, TextAnchor.NE, color)
+        return
+
+    def render_offscreen(self, main_render: callable, n_frames: int, width: int = 640, height: int = 480, on_frame: callable = None):
+        '''
+        Render the frames into the offscreen framebuffer as fast as possible,
+        there is no vsync wait, and the HUD is not drawn.
+
+        :param n_frames: The number of the frames.
+        :param width, height: The size of the framebuffer.
+        :param on_frame: Called with (frame index, pixels) after every frame,
+                         the pixels is the reused (height, width, 4) uint8 array, the row 0 is the bottom.
+
+        Without the display, like on the CI machine, run with PYOPENGL_PLATFORM=egl,
+        and the context is created by the EGL instead of the hidden GLFW window.
+        '''
+        if is_headless():
+            context = EGLContext(width, height)
+            terminate = context.close
+            self.window = None
+        else:
+            if not glfw.init():
+                raise RuntimeError('Failed initialize GLFW')
+
+            glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
+            window = glfw.create_window(width, height, 'Offscreen', None, None)
+            if not window:
+                glfw.terminate()
+                raise RuntimeError(f'Can not create window: {glfw.get_error()}')
+
+            terminate = glfw.terminate
+            self.window = window
+            glfw.make_context_current(window)
+            glfw.swap_interval(0)
+
+        self.width = width
+        self.height = height
+        self.refresh_rate = 0
+
+        fbo = glGenFramebuffers(1)
+        rbo = glGenRenderbuffers(1)
+        glBindRenderbuffer(GL_RENDERBUFFER, rbo)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+        glFramebufferRenderbuffer(
+            GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, rbo)
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            terminate()
+            raise RuntimeError('Offscreen framebuffer is not complete')
+        glViewport(0, 0, width, height)
+        self.text_renderer.viewport = (width, height)
+        logger.info(f'Rendering offscreen: {width} x {height}')
+
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+        pixels = np.empty((height, width, 4), dtype=np.uint8)
+        try:
+            for i in range(n_frames):
+                glClearColor(0.0, 0.0, 0.0, 0.0)
+                glClear(GL_COLOR_BUFFER_BIT)
+                main_render()
+                glReadPixels(0, 0, width, height, GL_RGBA,
+                             GL_UNSIGNED_BYTE, pixels)
+                if on_frame is not None:
+                    on_frame(i, pixels)
+                self.frame_count += 1
+        finally:
+            # The glyph textures belong to this context, so the next call starts with the empty cache.
+            self.text_renderer.release()
+            glDeleteFramebuffers(1, [fbo])
+            glDeleteRenderbuffers(1, [rbo])
+            terminate()
         return
 
     def draw_rect(self, x, y, w, h, color=(1, 1, 1, 1)):
@@ -352,8 +648,7 @@ class GLFWWindow:
 
         :param x, y, w, h: (0, 1) position and (0, 1) scale.
         '''
-        if isinstance(color, float):
-            color = (color, color, color, color)
+        color = as_color(color)
 
         # x = x * 2.0 - 1.0
         # y = y * 2.0 - 1.0
@@ -365,15 +660,13 @@ class GLFWWindow:
         w *= 2
         h *= 2
 
-        a = (x, y)
-        b = (x, y+h)
-        c = (x+w, y)
-        d = (x+w, y+h)
-
+        # The vertices are passed as scalars, no tuple is built per frame.
         glBegin(GL_QUAD_STRIP)
-        for e in [a, b, c, d]:
-            glColor4f(*color)
-            glVertex2f(*e)
+        glColor4f(*color)
+        glVertex2f(x, y)
+        glVertex2f(x, y+h)
+        glVertex2f(x+w, y)
+        glVertex2f(x+w, y+h)
         glEnd()
         return
 
@@ -384,38 +677,16 @@ class GLFWWindow:
         :param x: (0, 1) position.
         :param y: (0, 1) position.
         '''
-        if isinstance(color, float):
-            color = (color, color, color, color)
-
-        x = int(x * self.width)
-        y = int(y * self.height)
-        w, h = self.text_renderer.bounding_box(text, scale)
-
-        if anchor == TextAnchor.SW:
-            pass
-        elif anchor == TextAnchor.SE:
-            x -= w
-        elif anchor == TextAnchor.S:
-            x -= w // 2
-        elif anchor == TextAnchor.NE:
-            x -= w
-            y -= h
-        elif anchor == TextAnchor.NW:
-            y -= h
-        elif anchor == TextAnchor.N:
-            x -= w // 2
-            y -= h
-        elif anchor == TextAnchor.CENTER:
-            x -= w // 2
-            y -= h // 2
-        elif anchor == TextAnchor.W:
-            y -= h // 2
-        elif anchor == TextAnchor.E:
-            y -= h // 2
-            x -= w
+        color = as_color(color)
+
+        box = self.text_renderer.bounding_box(text, scale)
+        w, h = box
+        dx, dy = ANCHOR_OFFSETS[anchor]
+        x = int(x * self.width) - (w * dx) // 1
+        y = int(y * self.height) - (h * dy) // 1
 
         self.text_renderer.render_text(text, x, y, scale, color)
-        return w, h
+        return box
 
 
 # %% ---- 2025-04-13 ------------------------
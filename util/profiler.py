@@ -0,0 +1,208 @@
+"""
+File: profiler.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Per-stage frame profiler.
+
+    The scopes are timed in nanoseconds and stored in the preallocated ring,
+    they are exported as the Chrome trace-event json (chrome://tracing or Perfetto)
+    or aggregated into the per-stage percentiles.
+    The scope is the shared no-op object when the profiler is disabled.
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import os
+import json
+import numpy as np
+
+from time import perf_counter_ns
+
+from .logging import logger
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+class _NullScope:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SCOPE = _NullScope()
+
+
+class _Scope:
+    '''
+    The reusable scope of one stage, it is not reentrant.
+    '''
+    __slots__ = ('profiler', 'stage', 'tic')
+
+    def __init__(self, profiler, stage: int):
+        self.profiler = profiler
+        self.stage = stage
+        self.tic = 0
+
+    def __enter__(self):
+        self.tic = perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.record(self.stage, self.tic, perf_counter_ns())
+        return False
+
+
+class FrameProfiler:
+    '''
+    The frame profiler.
+
+    Usage:
+        with profiler.scope('main_render'):
+            ...
+    '''
+
+    def __init__(self, capacity: int = 1 << 16, enabled: bool = False):
+        '''
+        :param capacity: The number of the records kept in the ring.
+        :param enabled: Whether to record.
+        '''
+        self.enabled = enabled
+        self.capacity = capacity
+        self.stages = []
+        self.scopes = {}
+
+        self.stage = np.zeros(capacity, dtype=np.int32)
+        self.start = np.zeros(capacity, dtype=np.int64)
+        self.duration = np.zeros(capacity, dtype=np.int64)
+        self.frame = np.zeros(capacity, dtype=np.int64)
+        self.cursor = 0
+        self.frame_count = 0
+
+    def scope(self, name: str):
+        '''
+        Get the scope of the stage.
+        '''
+        if not self.enabled:
+            return _NULL_SCOPE
+        scope = self.scopes.get(name)
+        if scope is None:
+            self.stages.append(name)
+            scope = _Scope(self, len(self.stages) - 1)
+            self.scopes[name] = scope
+        return scope
+
+    def record(self, stage: int, tic: int, toc: int):
+        i = self.cursor % self.capacity
+        self.stage[i] = stage
+        self.start[i] = tic
+        self.duration[i] = toc - tic
+        self.frame[i] = self.frame_count
+        self.cursor += 1
+        return
+
+    def next_frame(self):
+        self.frame_count += 1
+        return
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        logger.info(f'Profiler enabled: {self.enabled}')
+        return
+
+    def clear(self):
+        self.cursor = 0
+        return
+
+    def _records(self):
+        '''
+        The records in the time order.
+        '''
+        n = min(self.cursor, self.capacity)
+        order = (np.arange(n) + self.cursor - n) % self.capacity
+        return (self.stage[order], self.start[order],
+                self.duration[order], self.frame[order])
+
+    def percentiles(self, q=(50, 90, 99)):
+        '''
+        Aggregate the records.
+
+        :param q: The percentiles.
+
+        :return: The stats in milliseconds, {stage: {'count', 'mean', 'max', 'p50', ...}}.
+        '''
+        stage, _, duration, _ = self._records()
+        stats = {}
+        for i, name in enumerate(self.stages):
+            d = duration[stage == i] / 1e6
+            if len(d) == 0:
+                continue
+            stats[name] = {'count': len(d), 'mean': d.mean(), 'max': d.max()}
+            for p, v in zip(q, np.percentile(d, q)):
+                stats[name][f'p{p}'] = v
+        return stats
+
+    def export_chrome_trace(self, path):
+        '''
+        Export the records as the Chrome trace-event json.
+        '''
+        stage, start, duration, frame = self._records()
+        t0 = start.min() if len(start) else 0
+        pid = os.getpid()
+        events = [
+            {
+                'name': self.stages[s],
+                'ph': 'X',
+                'ts': (t - t0) / 1e3,
+                'dur': d / 1e3,
+                'pid': pid,
+                'tid': 0,
+                'args': {'frame': int(f)},
+            }
+            for s, t, d, f in zip(stage.tolist(), start.tolist(), duration.tolist(), frame.tolist())
+        ]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        logger.info(f'Exported {len(events)} trace events: {path}')
+        return
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+if __name__ == "__main__":
+    import time
+
+    profiler = FrameProfiler(enabled=True)
+    for _ in range(100):
+        with profiler.scope('frame'):
+            with profiler.scope('work'):
+                time.sleep(0.001)
+            with profiler.scope('swap'):
+                time.sleep(0.002)
+        profiler.next_frame()
+
+    for name, stats in profiler.percentiles().items():
+        print(name, {k: round(v, 3) for k, v in stats.items()})
+    profiler.export_chrome_trace('trace.json')
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending